@@ -0,0 +1,586 @@
+# Google Sheets storage helpers used by streamlit_app.py.
+# They only need a gspread-like worksheet (get_all_records, get_all_values,
+# append_row, update), so they can also run against a fake sheet, e.g. from
+# loadtest.py, without Streamlit or Google credentials.
+import atexit
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# Expected headers in the sheet (rows written before event_id existed belong to the first event).
+# "ref" is a unique id per registration, used to push journaled rows exactly once.
+HEADERS = ["nom", "prenom", "email", "laboratoire", "accompagnants", "commentaire", "created_at", "event_id", "ref"]
+
+JOURNAL_RETENTION = 7 * 24 * 3600  # flushed journal rows are kept this long (seconds)
+FLUSH_MAX_DELAY = 60  # longest wait between two flush attempts after errors (seconds)
+# A batch claimed by another flusher (another wrapper on the same journal) is
+# left alone this long, then taken over (seconds, well above a push with retries)
+FLUSH_CLAIM_TIMEOUT = 300
+
+# Google Sheets API quota: 60 read and 60 write requests per minute and per user
+READS_PER_MINUTE = 60
+WRITES_PER_MINUTE = 60
+RETRY_ATTEMPTS = 5  # retries after the first failure of a call
+RETRY_BASE_DELAY = 1.0  # seconds, doubled after each failure
+RETRY_MAX_DELAY = 32.0
+
+# Client-side token bucket: `burst` calls at once, then the remaining quota
+# spread over the minute, so no 60-second window ever exceeds `per_minute`
+class TokenBucket:
+    def __init__(self, per_minute: int, burst: int = 10):
+        self.capacity = min(burst, per_minute)
+        self.rate = max(per_minute - self.capacity, 1) / 60.0  # tokens per second
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the time waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+# HTTP status of a gspread APIError (None for other exceptions)
+def _status(exc):
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+def _retryable(exc, write: bool) -> bool:
+    status = _status(exc)
+    if status == 429:
+        return True  # rejected by the quota: nothing was written
+    if write:
+        # A 5xx or a network error may come after the write went through:
+        # retrying could duplicate the row. The write-behind flusher checks
+        # the sheet before pushing again instead.
+        return False
+    return (status is not None and status >= 500) or isinstance(exc, OSError)
+
+def quota_buckets(reads_per_minute: int = READS_PER_MINUTE, writes_per_minute: int = WRITES_PER_MINUTE) -> dict:
+    return {"read": TokenBucket(reads_per_minute), "write": TokenBucket(writes_per_minute)}
+
+# Google counts the quota per user and project, not per worksheet: every
+# call of the process (all worksheets, opening the spreadsheet) shares them
+SHEETS_BUCKETS = quota_buckets()
+
+WRITE_METHODS = ("append_row", "append_rows", "update", "add_worksheet")
+
+def sheets_call(target, method: str, *args, buckets=None, record=None, **kwargs):
+    """Call target.method(*args, **kwargs) on the shared quota, retrying with
+    exponential backoff and full jitter.
+
+    record(method, latency, throttled, failed, retrying), if given, is called
+    after each attempt and may return the running number of calls to log.
+    """
+    write = method in WRITE_METHODS
+    bucket = (buckets or SHEETS_BUCKETS)["write" if write else "read"]
+    attempt = 0
+    while True:
+        throttled = bucket.acquire()
+        start = time.perf_counter()
+        try:
+            result = getattr(target, method)(*args, **kwargs)
+            error = None
+        except Exception as exc:
+            error = exc
+        latency = time.perf_counter() - start
+        retrying = error is not None and attempt < RETRY_ATTEMPTS and _retryable(error, write)
+        total = record(method, latency, throttled, error is not None, retrying) if record else None
+        if error is None:
+            log.info("Google Sheets API call: %s in %.0f ms%s", method, latency * 1000,
+                     " (%d calls so far)" % total if total else "")
+            return result
+        if not retrying:
+            log.warning("Google Sheets API call failed: %s (status %s): %s", method, _status(error), error)
+            raise error
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        attempt += 1
+        log.warning("Google Sheets API call failed: %s (status %s), retry %d in %.1f s",
+                    method, _status(error), attempt, delay)
+        time.sleep(delay)
+
+# Duplicate key for a name: spaces collapsed, case and accents folded
+# ("  Éloïse " == "eloise"), the same rule as inscription.normaliser_nom
+def normalize_name(value) -> str:
+    decomposed = unicodedata.normalize("NFKD", str(value or ""))
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+def _column_letter(n: int) -> str:
+    # 1 -> A, 8 -> H, 27 -> AA
+    letters = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        letters = chr(ord("A") + r) + letters
+    return letters
+
+# Worksheet wrapper keeping a local copy of the sheet, shared by every caller
+# (all Streamlit sessions of the process). Rows are only ever appended, so
+# after the first full read a refresh only fetches the tail: one batch_get of
+# the header row and of A{n}:{last column}, starting at the last row already
+# known. A changed header, or a first tail row that no longer matches that
+# last known row (rows edited, deleted or inserted), triggers a full resync.
+# New rows are added to the cached DataFrame, to running totals per event
+# and per lab, and to a set of normalized (event, nom, prenom) keys. The copy
+# is reused for `ttl` seconds; any write makes the next read refresh. Edits
+# to older rows cannot be seen from the tail, so a full resync also happens
+# every `resync_interval` seconds.
+#
+# With a `journal_path`, writes are deferred: append_row() commits the row to
+# a local SQLite journal and returns without any API call, and a background
+# thread pushes pending rows with append_rows() in batches of `batch_size`.
+# Until a row shows up in the sheet it is counted from the journal (totals,
+# duplicate check, DataFrame). Every row carries a unique "ref": after a
+# failed or interrupted push, the flusher re-reads the tail and skips the refs
+# already in the sheet before retrying, so a row is never appended twice.
+# Other attributes go to the wrapped worksheet.
+class CachedWorksheet:
+    def __init__(self, ws, ttl: float = 5.0, default_event_id: int = 1, resync_interval: float = 300.0,
+                 journal_path=None, batch_size: int = 200, flush_interval: float = 2.0, buckets=None):
+        self.ws = ws
+        self.ttl = ttl
+        self.resync_interval = resync_interval
+        self.default_event_id = default_event_id
+        self.api_calls = {}  # API method -> number of calls
+        # API method -> {"calls", "errors", "retries", "latency_s", "max_latency_s", "throttled_s"}
+        self.api_stats = {}
+        self._buckets = buckets or SHEETS_BUCKETS  # shared by every worksheet unless given
+        self.resyncs = 0
+        # Held by callers around "check remaining seats, then append" so two
+        # sessions of this process cannot both take the last seat
+        self.write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._fresh_at = None  # monotonic time of the last refresh
+        self._synced_at = None  # monotonic time of the last full read
+        self._header = None
+        self._rows = []  # one entry per sheet row after the header, padded to the header width
+        self._df = pd.DataFrame(columns=HEADERS)
+        self._totals = {}  # event_id -> {"inscrits", "accompagnants", "labos": {lab: seats}}
+        self._names = set()  # (event_id, normalize_name(nom), normalize_name(prenom))
+        self._refs = set()  # refs of the rows in the sheet
+        self._pending = {}  # ref -> row (HEADERS order) journaled but not seen in the sheet yet
+        self._sent = set()  # pending refs already pushed, waiting for the next read
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal = None
+        if journal_path:
+            self._open_journal(journal_path)
+
+    # Every Sheets API call of the wrapper goes through here: shared quota,
+    # retries (sheets_call), plus this worksheet's latency and error counters
+    def _call(self, method: str, *args, **kwargs):
+        return sheets_call(self.ws, method, *args, buckets=self._buckets, record=self._record, **kwargs)
+
+    def _record(self, method, latency, throttled, failed, retrying):
+        with self._counter_lock:
+            self.api_calls[method] = self.api_calls.get(method, 0) + 1
+            st = self.api_stats.setdefault(method, {"calls": 0, "errors": 0, "retries": 0, "latency_s": 0.0,
+                                                    "max_latency_s": 0.0, "throttled_s": 0.0})
+            st["calls"] += 1
+            st["latency_s"] += latency
+            st["max_latency_s"] = max(st["max_latency_s"], latency)
+            st["throttled_s"] += throttled
+            st["errors"] += failed
+            st["retries"] += retrying
+            return sum(self.api_calls.values())
+
+    def _pad(self, row, width=None):
+        width = width or len(self._header)
+        return [str(v) for v in row[:width]] + [""] * (width - len(row))
+
+    def _resync(self):
+        self.resyncs += 1
+        self._synced_at = time.monotonic()
+        values = self._call("get_all_values")
+        self._header = [h.strip().lower() for h in values[0]] if values else list(HEADERS)
+        self._rows = []
+        self._df = pd.DataFrame(columns=self._header)
+        self._totals = {}
+        self._names = set()
+        self._refs = set()
+        self._add_rows(values[1:])
+        # Pushed rows missing from a full read were removed from the sheet
+        for ref in self._sent - self._refs:
+            self._pending.pop(ref, None)
+        self._sent &= set(self._pending)
+        self._add_pending_names()
+
+    def _add_pending_names(self):
+        # Journaled rows not yet in the sheet still block a second registration
+        col = {h: i for i, h in enumerate(HEADERS)}
+        for row in self._pending.values():
+            self._count_row({}, row, col)  # records the name key
+
+    def _add_rows(self, rows):
+        rows = [self._pad(r) for r in rows]
+        self._rows.extend(rows)
+        rows = [r for r in rows if any(r)]  # blank rows keep their index but count for nothing
+        if not rows:
+            return
+        col = {h: i for i, h in enumerate(self._header)}
+        for r in rows:
+            self._count_row(self._totals, r, col)
+            if "ref" in col and r[col["ref"]]:
+                self._refs.add(r[col["ref"]])
+                self._pending.pop(r[col["ref"]], None)
+                self._sent.discard(r[col["ref"]])
+        delta = _normalize(pd.DataFrame(rows, columns=self._header), self.default_event_id)
+        self._df = delta if self._df.empty else pd.concat([self._df, delta], ignore_index=True)
+
+    def _count_row(self, totals, row, col):
+        event_id = _to_int(row[col["event_id"]] if "event_id" in col else "", self.default_event_id)
+        accomp = _to_int(row[col["accompagnants"]] if "accompagnants" in col else "", 0)
+        labo = row[col["laboratoire"]] if "laboratoire" in col else ""
+        t = totals.setdefault(event_id, {"inscrits": 0, "accompagnants": 0, "labos": {}})
+        t["inscrits"] += 1
+        t["accompagnants"] += accomp
+        t["labos"][labo] = t["labos"].get(labo, 0) + 1 + accomp
+        if "nom" in col and "prenom" in col:
+            self._names.add((event_id, normalize_name(row[col["nom"]]), normalize_name(row[col["prenom"]])))
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._fresh_at is not None and now - self._fresh_at <= self.ttl:
+            return
+        if self._header is None or now - self._synced_at > self.resync_interval:
+            self._resync()
+        else:
+            last = len(self._rows) + 1  # sheet row of the last known row (row 1 = header)
+            column = _column_letter(len(self._header))
+            header, tail = self._call("batch_get", ["A1:%s1" % column, "A%d:%s" % (last, column)])
+            known = self._rows[-1] if self._rows else self._header
+            if (not header or [h.strip().lower() for h in self._pad(header[0])] != self._header
+                    or not tail or self._pad(tail[0]) != known):
+                self._resync()
+            else:
+                self._add_rows(tail[1:])
+        self._fresh_at = now
+
+    def invalidate(self):
+        with self._lock:
+            self._fresh_at = None
+
+    def dataframe(self) -> pd.DataFrame:
+        """Cached DataFrame of the sheet and pending rows; callers must not modify it in place."""
+        with self._lock:
+            self._refresh()
+            if not self._pending:
+                return self._df
+            pending = _normalize(pd.DataFrame(list(self._pending.values()), columns=HEADERS),
+                                 self.default_event_id)
+            return pending if self._df.empty else pd.concat([self._df, pending], ignore_index=True)
+
+    def totals(self, event_id: int):
+        """Seats taken for one event: (inscrits, accompagnants, {lab: seats})."""
+        with self._lock:
+            self._refresh()
+            t = self._totals.get(event_id, {"inscrits": 0, "accompagnants": 0, "labos": {}})
+            inscrits, accompagnants, labos = t["inscrits"], t["accompagnants"], dict(t["labos"])
+            if self._pending:
+                extra = {}
+                col = {h: i for i, h in enumerate(HEADERS)}
+                for row in self._pending.values():
+                    self._count_row(extra, row, col)
+                e = extra.get(event_id, {"inscrits": 0, "accompagnants": 0, "labos": {}})
+                inscrits += e["inscrits"]
+                accompagnants += e["accompagnants"]
+                for lab, seats in e["labos"].items():
+                    labos[lab] = labos.get(lab, 0) + seats
+            return inscrits, accompagnants, labos
+
+    def has_name(self, event_id: int, nom: str, prenom: str) -> bool:
+        """O(1) duplicate check; only the very first call reads the sheet.
+
+        Rows appended through this wrapper are added to the set right away;
+        rows appended by another process show up at the next refresh.
+        """
+        with self._lock:
+            if self._header is None:
+                self._refresh()
+            return (event_id, normalize_name(nom), normalize_name(prenom)) in self._names
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def get_all_records(self):
+        with self._lock:
+            self._refresh()
+            records = [dict(zip(self._header, r)) for r in self._rows if any(r)]
+            return records + [dict(zip(HEADERS, r)) for r in self._pending.values()]
+
+    def api_stats_snapshot(self) -> dict:
+        with self._counter_lock:
+            return {method: dict(st) for method, st in self.api_stats.items()}
+
+    def get_all_values(self):
+        return self._call("get_all_values")
+
+    def append_row(self, row, **kwargs):
+        if self.journal is not None:
+            return self._journal_row(self._pad(row, len(HEADERS)))
+        try:
+            result = self._call("append_row", row, **kwargs)
+        finally:
+            self.invalidate()
+        # The row's position is only known after the next tail read, but its
+        # name key can be recorded now (adding it again later is harmless)
+        with self._lock:
+            if self._header is not None:
+                row = self._pad(row)
+                self._count_row({}, row, {h: i for i, h in enumerate(self._header)})  # records the name key
+        return result
+
+    def update(self, *args, **kwargs):
+        try:
+            return self._call("update", *args, **kwargs)
+        finally:
+            self.invalidate()
+
+    # ------------------ Write-behind journal ------------------
+    def _open_journal(self, path):
+        self.journal = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.journal.execute("PRAGMA journal_mode = WAL")
+        self.journal.execute("PRAGMA synchronous = FULL")  # a confirmed registration survives a crash
+        self.journal.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                ref TEXT PRIMARY KEY,
+                row TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                flushed_at REAL,
+                claimed_by TEXT,
+                claimed_at REAL
+            )
+        """)
+        self.journal.execute("CREATE INDEX IF NOT EXISTS idx_journal_pending ON journal(created_at) WHERE flushed_at IS NULL")
+        # Rows are claimed in the journal before each push: a claimed row may
+        # already be in the sheet, and only one flusher pushes it at a time
+        self.journal.execute("BEGIN IMMEDIATE")
+        if "claimed_by" not in {col[1] for col in self.journal.execute("PRAGMA table_info(journal)")}:
+            self.journal.execute("ALTER TABLE journal ADD COLUMN claimed_by TEXT")
+            self.journal.execute("ALTER TABLE journal ADD COLUMN claimed_at REAL")
+            # Journals written before claims existed: leftover rows may have been pushed
+            self.journal.execute("UPDATE journal SET claimed_by = '', claimed_at = 0 WHERE flushed_at IS NULL")
+        self.journal.execute("COMMIT")
+        self._claim_id = uuid.uuid4().hex
+        self.journal.execute("DELETE FROM journal WHERE flushed_at < ?", (time.time() - JOURNAL_RETENTION,))
+        self._journal_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        with self._journal_lock:
+            pending = self.journal.execute(
+                "SELECT ref, row FROM journal WHERE flushed_at IS NULL ORDER BY created_at").fetchall()
+        with self._lock:
+            for ref, row in pending:
+                self._pending[ref] = self._pad(json.loads(row), len(HEADERS))
+            self._add_pending_names()
+        self._flusher = threading.Thread(target=self._flush_loop, name="gsheet-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self._flush_at_exit)
+
+    def _journal_row(self, row):
+        ref = row[HEADERS.index("ref")]
+        if not ref:
+            raise ValueError("journaled rows need a ref")
+        with self._journal_lock:
+            self.journal.execute("INSERT OR IGNORE INTO journal (ref, row, created_at) VALUES (?, ?, ?)",
+                                 (ref, json.dumps(row), time.time()))
+        with self._lock:
+            if ref not in self._refs:
+                self._pending[ref] = row
+            self._count_row({}, row, {h: i for i, h in enumerate(HEADERS)})  # records the name key
+            full = len(self._pending) - len(self._sent) >= self.batch_size
+        if full:
+            self._wake.set()
+        return ref
+
+    def _claim_batch(self):
+        """Claim the oldest unflushed rows that no other live flusher holds.
+
+        Returns [(ref, row, claimed before)]: a row claimed before (by us after
+        a failed push, or by a flusher that stalled or died) may be in the sheet.
+        """
+        now = time.time()
+        with self._journal_lock:
+            self.journal.execute("BEGIN IMMEDIATE")
+            try:
+                batch = self.journal.execute("""
+                    SELECT ref, row, claimed_by IS NOT NULL FROM journal
+                    WHERE flushed_at IS NULL AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)
+                    ORDER BY created_at LIMIT ?
+                """, (self._claim_id, now - FLUSH_CLAIM_TIMEOUT, self.batch_size)).fetchall()
+                self.journal.executemany("UPDATE journal SET claimed_by = ?, claimed_at = ? WHERE ref = ?",
+                                         [(self._claim_id, now, ref) for ref, _, _ in batch])
+                self.journal.execute("COMMIT")
+            except BaseException:
+                self.journal.execute("ROLLBACK")
+                raise
+        return batch
+
+    def flush(self) -> int:
+        """Push one batch of journaled rows; returns how many rows were appended."""
+        with self._flush_lock:
+            batch = self._claim_batch()
+            if not batch:
+                return 0
+            if any(claimed for _, _, claimed in batch):
+                # An earlier push may have reached the sheet: look before retrying
+                with self._lock:
+                    self._fresh_at = None
+                    self._refresh()
+                    present = [ref for ref, _, _ in batch if ref in self._refs]
+                self._mark_flushed(present)
+                batch = [entry for entry in batch if entry[0] not in present]
+            if not batch:
+                return 0
+            # On failure, here or while marking the rows, the claims stay in
+            # the journal and the next attempt reconciles with the sheet first
+            self._call("append_rows", [json.loads(row) for _, row, _ in batch])
+            self._mark_flushed([ref for ref, _, _ in batch])
+            with self._lock:
+                self._sent.update(ref for ref, _, _ in batch if ref in self._pending)
+                self._fresh_at = None
+            return len(batch)
+
+    def _mark_flushed(self, refs):
+        if not refs:
+            return
+        with self._journal_lock:
+            self.journal.executemany("UPDATE journal SET flushed_at = ? WHERE ref = ?",
+                                     [(time.time(), ref) for ref in refs])
+
+    def _flush_loop(self):
+        delay = self.flush_interval
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                while self.flush() == self.batch_size:
+                    pass
+                delay = self.flush_interval
+            except Exception:
+                # Quota or network error: the rows stay in the journal, retry later
+                delay = min(delay * 2, FLUSH_MAX_DELAY)
+                log.exception("Google Sheets flush failed, next attempt in %.0f s", delay)
+
+    def _flush_at_exit(self):
+        try:
+            while self.flush():
+                pass
+        except Exception:
+            log.exception("Google Sheets flush at exit failed; rows stay in the journal")
+
+    def __getattr__(self, name):
+        return getattr(self.ws, name)
+
+def _to_int(value, default: int) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+# Make sure the first row holds our headers
+def ensure_headers(ws):
+    # On a CachedWorksheet, go through its API wrapper but around the journal
+    if isinstance(ws, CachedWorksheet):
+        call = ws._call
+    else:
+        call = lambda method, *args, **kwargs: sheets_call(ws, method, *args, **kwargs)
+    values = call("get_all_values")
+    if not values:
+        call("append_row", HEADERS)
+    else:
+        # If headers present but not matching, ensure at least columns exist
+        if [h.strip().lower() for h in values[0]] != HEADERS:
+            # Try to set the first row to our headers (non-destructive if already in place)
+            call("update", 'A1', [HEADERS])
+
+# Normalize dtypes of a sheet DataFrame
+def _normalize(df: pd.DataFrame, default_event_id: int) -> pd.DataFrame:
+    if "accompagnants" in df.columns:
+        df["accompagnants"] = pd.to_numeric(df["accompagnants"], errors="coerce").fillna(0).astype(int)
+    if "event_id" not in df.columns:
+        df["event_id"] = default_event_id
+    df["event_id"] = pd.to_numeric(df["event_id"], errors="coerce").fillna(default_event_id).astype(int)
+    return df
+
+# Read entire sheet into DataFrame (excluding header row); a CachedWorksheet
+# answers from its local copy, with its own default_event_id
+def gsheet_to_df(ws, default_event_id: int = 1) -> pd.DataFrame:
+    if isinstance(ws, CachedWorksheet):
+        return ws.dataframe()
+    rows = ws.get_all_records()  # returns list of dicts, using first row as header
+    if not rows:
+        return pd.DataFrame(columns=HEADERS)
+    return _normalize(pd.DataFrame(rows), default_event_id)
+
+def nom_prenom_deja_inscrit(ws, nom: str, prenom: str, event_id: int, default_event_id: int = 1) -> bool:
+    if isinstance(ws, CachedWorksheet):
+        return ws.has_name(event_id, nom, prenom)
+    df = gsheet_to_df(ws, default_event_id)
+    df = df[df["event_id"] == event_id]
+    if df.empty or not {"nom", "prenom"}.issubset(df.columns):
+        return False
+    n = normalize_name(nom)
+    p = normalize_name(prenom)
+    return ((df["nom"].map(normalize_name) == n) & (df["prenom"].map(normalize_name) == p)).any()
+
+# Append one inscription (values must follow HEADERS order)
+def append_inscription(ws, data: dict):
+    row = [data.get("nom",""), data.get("prenom",""), data.get("email",""),
+           data.get("laboratoire",""), int(data.get("accompagnants",0)),
+           data.get("commentaire",""), data.get("created_at",""), int(data["event_id"]),
+           data.get("ref") or uuid.uuid4().hex]
+    ws.append_row(row)
+
+# ------------------ Business logic ------------------
+# Seats taken for one event: (inscrits, accompagnants, {lab: seats}), from the
+# running totals of a CachedWorksheet or computed from a full read
+def event_totals(ws, event_id: int, default_event_id: int = 1):
+    if isinstance(ws, CachedWorksheet):
+        return ws.totals(event_id)
+    df = gsheet_to_df(ws, default_event_id)
+    df = df[df["event_id"] == event_id]
+    if df.empty:
+        return 0, 0, {}
+    par_labo = df.groupby("laboratoire")["accompagnants"].agg(["size", "sum"]).sum(axis=1)
+    return len(df), int(df["accompagnants"].sum()), {lab: int(v) for lab, v in par_labo.items()}
+
+# `event` is one entry of the configured events (id, capacite, quotas, reserves)
+def get_places_stats(ws, event: dict, default_event_id: int = 1):
+    capacite = int(event["capacite"])
+    count_inscrits, sum_accomp, _ = event_totals(ws, int(event["id"]), default_event_id)  # one row per salarié inscrit
+    total = count_inscrits + sum_accomp
+    restantes = capacite - total
+    return max(total, 0), max(restantes, 0)
+
+# Seats a lab can still take: remaining seats of the event, minus the seats
+# still reserved for other labs, within the lab's own quota
+def places_disponibles_labo(ws, event: dict, laboratoire: str, default_event_id: int = 1):
+    count_inscrits, sum_accomp, par_labo = event_totals(ws, int(event["id"]), default_event_id)
+    restantes = max(int(event["capacite"]) - count_inscrits - sum_accomp, 0)
+    reserve_autres = sum(max(int(r) - int(par_labo.get(lab, 0)), 0)
+                         for lab, r in event.get("reserves", {}).items() if lab != laboratoire)
+    disponibles = restantes - reserve_autres
+    quota = event.get("quotas", {}).get(laboratoire)
+    if quota is not None:
+        disponibles = min(disponibles, int(quota) - int(par_labo.get(laboratoire, 0)))
+    return restantes, disponibles
@@ -1,88 +1,1018 @@
-from flask import Flask, request, redirect, url_for, render_template_string, session, flash, Response
+from flask import Flask, request, redirect, url_for, render_template, session, flash, Response, g, jsonify, abort
+from flask import before_render_template, template_rendered
+from werkzeug.middleware.proxy_fix import ProxyFix
 import sqlite3
 import os
 import csv
 import io
+import threading
+import hashlib
+import zlib
+import time
+import unicodedata
+import bisect
+import cProfile
+import pstats
+import marshal
+import itertools
+import collections
 
 app = Flask(__name__)
 app.secret_key = 'vraimentsecret'  # Nécessaire pour la session
 DB_FILE = 'inscriptions.db'
 ADMIN_PASSWORD = 'admin123'
-MAX_PLACES = 50
+MAX_PLACES = 50  # capacité par défaut d'un nouvel événement
+LABS = ["Ma1","Ma2","Bo","ÇA","IS","DE","BS","YS","CL","DA","ME","SH","AM","EU","SS","FL","QG"]
 
-# Création auto de la table si besoin
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # Check if 'laboratoire' column exists
-    c.execute("PRAGMA table_info(inscriptions)")
-    columns = [col[1] for col in c.fetchall()]
+# Réglages SQLite, surchargeables par variables d'environnement.
+# WAL laisse liste()/export_csv() lire pendant que les inscriptions écrivent ;
+# avec WAL, synchronous=NORMAL reste sûr en cas de crash applicatif.
+app.config.update(
+    SQLITE_JOURNAL_MODE=os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    SQLITE_SYNCHRONOUS=os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    SQLITE_BUSY_TIMEOUT_MS=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 30000)),
+    SQLITE_MMAP_SIZE=int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024)),
+    SQLITE_CACHE_SIZE=int(os.environ.get('SQLITE_CACHE_SIZE', -8000)),  # négatif = en Kio
+)
+
+# Contrôle d'admission de POST / à l'ouverture des inscriptions : débit par
+# adresse IP (seau à jetons) et nombre d'inscriptions traitées en parallèle.
+# Les valeurs par défaut supposent que tout un laboratoire arrive par la même
+# adresse (NAT de l'établissement) : le seau par IP n'arrête qu'un client qui
+# s'emballe, la limite de concurrence protège la base.
+app.config.update(
+    ADMISSION_DEBIT_IP=float(os.environ.get('ADMISSION_DEBIT_IP', 5)),  # jetons par seconde
+    ADMISSION_RAFALE_IP=int(os.environ.get('ADMISSION_RAFALE_IP', 50)),
+    ADMISSION_CONCURRENCE_MAX=int(os.environ.get('ADMISSION_CONCURRENCE_MAX', 8)),
+)
+
+# Derrière un ou plusieurs proxys inverses (nginx, etc.), indiquer leur nombre :
+# l'adresse du client est alors lue dans X-Forwarded-For. À laisser à 0 sans
+# proxy, sinon n'importe quel client pourrait choisir son adresse.
+app.config.update(
+    PROXIES_DE_CONFIANCE=int(os.environ.get('PROXIES_DE_CONFIANCE', 0)),
+)
+if app.config['PROXIES_DE_CONFIANCE']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXIES_DE_CONFIANCE'],
+                            x_proto=app.config['PROXIES_DE_CONFIANCE'])
+
+# /metrics est réservé aux admins ; un collecteur Prometheus peut aussi
+# s'authentifier avec « Authorization: Bearer <METRIQUES_JETON> »
+app.config.update(
+    METRIQUES_JETON=os.environ.get('METRIQUES_JETON', ''),
+)
+
+# Profilage à la demande : une requête portant « X-Profil: <PROFIL_JETON> »,
+# ou faite par un admin qui l'a activé, passe sous cProfile ; les PROFILS_MAX
+# derniers profils restent téléchargeables
+app.config.update(
+    PROFIL_JETON=os.environ.get('PROFIL_JETON', ''),
+    PROFILS_MAX=int(os.environ.get('PROFILS_MAX', 20)),
+)
+
+# Schéma versionné par PRAGMA user_version : chaque migration n'est jouée
+# qu'une fois. Au démarrage, si le schéma est à jour, init_db() se résume à
+# lire un entier. Sinon les migrations s'exécutent sous BEGIN EXCLUSIVE et la
+# version est relue une fois le verrou obtenu, pour que plusieurs workers
+# gunicorn qui démarrent ensemble ne les appliquent pas deux fois.
+def _migration_table_inscriptions(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS inscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            prenom TEXT NOT NULL,
+            email TEXT NOT NULL,
+            laboratoire TEXT,
+            accompagnants INTEGER,
+            commentaire TEXT
+        )
+    ''')
+    # Anciennes bases créées avant l'ajout de la colonne laboratoire
+    columns = [col[1] for col in c.execute('PRAGMA table_info(inscriptions)')]
     if 'laboratoire' not in columns:
-        # If table does not exist, create it with laboratoire column
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS inscriptions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nom TEXT NOT NULL,
-                prenom TEXT NOT NULL,
-                email TEXT NOT NULL,
-                laboratoire TEXT,
-                accompagnants INTEGER,
-                commentaire TEXT
-            )
-        ''')
-        conn.commit()
-        # If table existed before without laboratoire column, add it
-        if 'laboratoire' not in columns:
-            try:
-                c.execute('ALTER TABLE inscriptions ADD COLUMN laboratoire TEXT')
-                conn.commit()
-            except sqlite3.OperationalError:
-                # Column already exists or table just created
-                pass
-    else:
-        # Table exists and has laboratoire column, ensure table exists
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS inscriptions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nom TEXT NOT NULL,
-                prenom TEXT NOT NULL,
-                email TEXT NOT NULL,
-                laboratoire TEXT,
-                accompagnants INTEGER,
-                commentaire TEXT
-            )
-        ''')
-        conn.commit()
-    conn.close()
+        c.execute('ALTER TABLE inscriptions ADD COLUMN laboratoire TEXT')
+
+def _migration_compteur_places(c):
+    # Compteur de places tenu à jour par des triggers : la lecture des places
+    # restantes ne dépend plus du nombre de lignes dans inscriptions.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS places_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            inscrits INTEGER NOT NULL,
+            accompagnants INTEGER NOT NULL
+        )
+    ''')
+    c.execute('''
+        INSERT OR IGNORE INTO places_stats (id, inscrits, accompagnants)
+            SELECT 1, COUNT(*), COALESCE(SUM(accompagnants), 0) FROM inscriptions
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS places_stats_insert AFTER INSERT ON inscriptions
+        BEGIN
+            UPDATE places_stats SET inscrits = inscrits + 1,
+                accompagnants = accompagnants + COALESCE(NEW.accompagnants, 0) WHERE id = 1;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS places_stats_delete AFTER DELETE ON inscriptions
+        BEGIN
+            UPDATE places_stats SET inscrits = inscrits - 1,
+                accompagnants = accompagnants - COALESCE(OLD.accompagnants, 0) WHERE id = 1;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS places_stats_update AFTER UPDATE OF accompagnants ON inscriptions
+        BEGIN
+            UPDATE places_stats SET
+                accompagnants = accompagnants - COALESCE(OLD.accompagnants, 0) + COALESCE(NEW.accompagnants, 0) WHERE id = 1;
+        END
+    ''')
+
+def _migration_index_liste(c):
+    # Index pour les filtres de /liste (pagination par id décroissant)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_inscriptions_labo ON inscriptions(laboratoire, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_inscriptions_nom ON inscriptions(nom COLLATE NOCASE)')
+
+# Les doublons nom + prénom sont refusés par un index UNIQUE sur des colonnes
+# normalisées (espaces, casse, accents). SQLite ne sait pas retirer les
+# accents (lower() ne traite que l'ASCII) : les colonnes sont donc remplies
+# par l'application à l'écriture plutôt que générées par SQLite.
+def normaliser_nom(valeur):
+    decompose = unicodedata.normalize('NFKD', valeur or '')
+    sans_accents = ''.join(ch for ch in decompose if not unicodedata.combining(ch))
+    return ' '.join(sans_accents.casefold().split())
+
+def _migration_noms_normalises(c):
+    c.execute('ALTER TABLE inscriptions ADD COLUMN nom_norm TEXT')
+    c.execute('ALTER TABLE inscriptions ADD COLUMN prenom_norm TEXT')
+    # Les doublons déjà présents gardent des colonnes NULL (non concernées par
+    # l'index UNIQUE) : seule la première inscription est normalisée.
+    vus = set()
+    maj = []
+    for id_, nom, prenom in c.execute('SELECT id, nom, prenom FROM inscriptions ORDER BY id').fetchall():
+        cle = (normaliser_nom(nom), normaliser_nom(prenom))
+        if cle not in vus:
+            vus.add(cle)
+            maj.append(cle + (id_,))
+    c.executemany('UPDATE inscriptions SET nom_norm = ?, prenom_norm = ? WHERE id = ?', maj)
+    c.execute('CREATE UNIQUE INDEX idx_inscriptions_nom_prenom ON inscriptions(nom_norm, prenom_norm)')
+
+# Plusieurs séances par saison : chaque inscription est rattachée à un
+# événement, avec sa propre capacité et son propre compteur de places
+# (places_evenement, une ligne par événement, lue par clé primaire).
+def _migration_evenements(c):
+    c.execute('''
+        CREATE TABLE evenements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            titre TEXT NOT NULL,
+            date TEXT,
+            lieu TEXT,
+            capacite INTEGER NOT NULL,
+            ouvert INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    c.execute('''
+        INSERT INTO evenements (id, titre, date, lieu, capacite)
+        VALUES (1, 'Badmington 28/09/2025', 'Dimanche 28/09/2025 matin',
+                'Gymnase du lycée Val de Seine, 5–11 Avenue Georges Braque, 76120 Le Grand-Quevilly', ?)
+    ''', (MAX_PLACES,))
+    c.execute('ALTER TABLE inscriptions ADD COLUMN event_id INTEGER NOT NULL DEFAULT 1 REFERENCES evenements(id)')
+    # Le compteur global est remplacé par un compteur par événement
+    for trigger in ('places_stats_insert', 'places_stats_delete', 'places_stats_update'):
+        c.execute('DROP TRIGGER IF EXISTS %s' % trigger)
+    c.execute('DROP TABLE IF EXISTS places_stats')
+    c.execute('''
+        CREATE TABLE places_evenement (
+            event_id INTEGER PRIMARY KEY REFERENCES evenements(id),
+            inscrits INTEGER NOT NULL DEFAULT 0,
+            accompagnants INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('''
+        INSERT INTO places_evenement (event_id, inscrits, accompagnants)
+            SELECT e.id, COUNT(i.id), COALESCE(SUM(i.accompagnants), 0)
+            FROM evenements e LEFT JOIN inscriptions i ON i.event_id = e.id GROUP BY e.id
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_evenement_creation AFTER INSERT ON evenements
+        BEGIN
+            INSERT INTO places_evenement (event_id) VALUES (NEW.id);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_evenement_insert AFTER INSERT ON inscriptions
+        BEGIN
+            UPDATE places_evenement SET inscrits = inscrits + 1,
+                accompagnants = accompagnants + COALESCE(NEW.accompagnants, 0) WHERE event_id = NEW.event_id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_evenement_delete AFTER DELETE ON inscriptions
+        BEGIN
+            UPDATE places_evenement SET inscrits = inscrits - 1,
+                accompagnants = accompagnants - COALESCE(OLD.accompagnants, 0) WHERE event_id = OLD.event_id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_evenement_update AFTER UPDATE OF accompagnants, event_id ON inscriptions
+        BEGIN
+            UPDATE places_evenement SET inscrits = inscrits - 1,
+                accompagnants = accompagnants - COALESCE(OLD.accompagnants, 0) WHERE event_id = OLD.event_id;
+            UPDATE places_evenement SET inscrits = inscrits + 1,
+                accompagnants = accompagnants + COALESCE(NEW.accompagnants, 0) WHERE event_id = NEW.event_id;
+        END
+    ''')
+    # Tous les index de inscriptions commencent désormais par event_id
+    for index in ('idx_inscriptions_labo', 'idx_inscriptions_nom', 'idx_inscriptions_nom_prenom'):
+        c.execute('DROP INDEX IF EXISTS %s' % index)
+    c.execute('CREATE INDEX idx_inscriptions_event ON inscriptions(event_id, id)')
+    c.execute('CREATE INDEX idx_inscriptions_event_labo ON inscriptions(event_id, laboratoire, id)')
+    c.execute('CREATE INDEX idx_inscriptions_event_nom ON inscriptions(event_id, nom COLLATE NOCASE)')
+    c.execute('CREATE UNIQUE INDEX idx_inscriptions_event_nom_prenom ON inscriptions(event_id, nom_norm, prenom_norm)')
+
+# Quotas et places réservées par laboratoire (optionnels, par événement).
+# places_labo est tenu à jour par des triggers, comme places_evenement, pour
+# ne jamais faire de GROUP BY sur inscriptions pendant une inscription.
+def _migration_quotas_labo(c):
+    c.execute('''
+        CREATE TABLE quotas_labo (
+            event_id INTEGER NOT NULL REFERENCES evenements(id),
+            laboratoire TEXT NOT NULL,
+            quota INTEGER,
+            reserve INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (event_id, laboratoire)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE places_labo (
+            event_id INTEGER NOT NULL REFERENCES evenements(id),
+            laboratoire TEXT NOT NULL,
+            places INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (event_id, laboratoire)
+        )
+    ''')
+    c.execute('''
+        INSERT INTO places_labo (event_id, laboratoire, places)
+            SELECT event_id, COALESCE(laboratoire, ''), COUNT(*) + COALESCE(SUM(accompagnants), 0)
+            FROM inscriptions GROUP BY event_id, COALESCE(laboratoire, '')
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_labo_insert AFTER INSERT ON inscriptions
+        BEGIN
+            INSERT INTO places_labo (event_id, laboratoire, places)
+                VALUES (NEW.event_id, COALESCE(NEW.laboratoire, ''), 1 + COALESCE(NEW.accompagnants, 0))
+                ON CONFLICT (event_id, laboratoire) DO UPDATE SET places = places + excluded.places;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_labo_delete AFTER DELETE ON inscriptions
+        BEGIN
+            UPDATE places_labo SET places = places - 1 - COALESCE(OLD.accompagnants, 0)
+                WHERE event_id = OLD.event_id AND laboratoire = COALESCE(OLD.laboratoire, '');
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER places_labo_update AFTER UPDATE OF accompagnants, event_id, laboratoire ON inscriptions
+        BEGIN
+            UPDATE places_labo SET places = places - 1 - COALESCE(OLD.accompagnants, 0)
+                WHERE event_id = OLD.event_id AND laboratoire = COALESCE(OLD.laboratoire, '');
+            INSERT INTO places_labo (event_id, laboratoire, places)
+                VALUES (NEW.event_id, COALESCE(NEW.laboratoire, ''), 1 + COALESCE(NEW.accompagnants, 0))
+                ON CONFLICT (event_id, laboratoire) DO UPDATE SET places = places + excluded.places;
+        END
+    ''')
+
+# Liste d'attente par événement, dans l'ordre d'arrivée (id croissant). La
+# tête de liste se lit par l'index (event_id, id) : promouvoir une entrée ne
+# dépend pas de la longueur de la liste.
+def _migration_liste_attente(c):
+    c.execute('''
+        CREATE TABLE liste_attente (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL REFERENCES evenements(id),
+            nom TEXT NOT NULL,
+            prenom TEXT NOT NULL,
+            email TEXT NOT NULL,
+            laboratoire TEXT,
+            accompagnants INTEGER NOT NULL DEFAULT 0,
+            commentaire TEXT,
+            nom_norm TEXT NOT NULL,
+            prenom_norm TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX idx_liste_attente_event ON liste_attente(event_id, id)')
+    c.execute('CREATE UNIQUE INDEX idx_liste_attente_nom_prenom ON liste_attente(event_id, nom_norm, prenom_norm)')
+
+# Jetons de soumission du formulaire (clés d'idempotence) : un renvoi du
+# même formulaire retrouve le résultat déjà enregistré au lieu de créer une
+# seconde inscription. Index sur created_at pour purger les jetons expirés.
+def _migration_soumissions(c):
+    c.execute('''
+        CREATE TABLE soumissions (
+            jeton TEXT PRIMARY KEY,
+            event_id INTEGER NOT NULL REFERENCES evenements(id),
+            statut TEXT NOT NULL,
+            accomp_demandes INTEGER NOT NULL,
+            accompagnants INTEGER,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX idx_soumissions_created_at ON soumissions(created_at)')
+
+# Tête de liste d'attente de chaque laboratoire : la promotion saute un
+# laboratoire bloqué par son quota en une lecture, quelle que soit sa file.
+def _migration_attente_par_labo(c):
+    c.execute('CREATE INDEX idx_liste_attente_labo ON liste_attente(event_id, laboratoire, id)')
+
+# Ne jamais modifier ni réordonner : ajouter les nouvelles migrations à la fin
+MIGRATIONS = [
+    _migration_table_inscriptions,
+    _migration_compteur_places,
+    _migration_index_liste,
+    _migration_noms_normalises,
+    _migration_evenements,
+    _migration_quotas_labo,
+    _migration_liste_attente,
+    _migration_soumissions,
+    _migration_attente_par_labo,
+]
+
+def init_db():
+    conn = sqlite3.connect(DB_FILE, timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+            return
+        c = conn.cursor()
+        c.execute('BEGIN EXCLUSIVE')
+        try:
+            version = c.execute('PRAGMA user_version').fetchone()[0]
+            for migration in MIGRATIONS[version:]:
+                migration(c)
+            c.execute('PRAGMA user_version = %d' % max(version, len(MIGRATIONS)))
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
 
 init_db()
 
-# Calcul des places utilisées/restantes
-def get_places_stats():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # total = nombre d'inscrits + somme des accompagnants
-    c.execute('SELECT COUNT(*), COALESCE(SUM(accompagnants), 0) FROM inscriptions')
-    count_inscrits, sum_accomp = c.fetchone()
+# Métriques (format texte Prometheus, servies par /metrics) : histogrammes de
+# durée par route, par type de requête SQLite et par template. Une mesure
+# coûte deux perf_counter() et un verrou, on peut les laisser en production.
+HISTO_SEUILS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_metriques_lock = threading.Lock()
+_histogrammes = {}  # (métrique, étiquettes) -> [effectif par seuil..., +Inf, somme]
+
+def observer(metrique, etiquettes, duree):
+    i = bisect.bisect_left(HISTO_SEUILS, duree)
+    with _metriques_lock:
+        h = _histogrammes.get((metrique, etiquettes))
+        if h is None:
+            h = _histogrammes[(metrique, etiquettes)] = [0] * (len(HISTO_SEUILS) + 1) + [0.0]
+        h[i] += 1
+        h[-1] += duree
+
+def _noter_sql(sql, debut):
+    # Étiquette = premier mot de la requête (SELECT, INSERT, BEGIN, COMMIT...)
+    mot = sql.lstrip()[:10].split(None, 1)
+    observer('inscription_sqlite_requete_duree_secondes', (('type', mot[0].upper() if mot else ''),),
+             time.perf_counter() - debut)
+
+# Curseur et connexion qui chronomètrent execute()/executemany() ; la lecture
+# des lignes (fetchone, fetchmany...) n'est pas comptée
+class CurseurMesure(sqlite3.Cursor):
+    def execute(self, sql, parametres=()):
+        debut = time.perf_counter()
+        try:
+            return super().execute(sql, parametres)
+        finally:
+            _noter_sql(sql, debut)
+
+    def executemany(self, sql, parametres):
+        debut = time.perf_counter()
+        try:
+            return super().executemany(sql, parametres)
+        finally:
+            _noter_sql(sql, debut)
+
+class ConnexionMesuree(sqlite3.Connection):
+    def cursor(self, factory=CurseurMesure):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametres=()):
+        return self.cursor().execute(sql, parametres)
+
+    def executemany(self, sql, parametres):
+        return self.cursor().executemany(sql, parametres)
+
+@app.before_request
+def debut_requete():
+    g._debut = time.perf_counter()
+
+@app.after_request
+def mesurer_requete(response):
+    debut = g.get('_debut')
+    # Le flux SSE reste ouvert indéfiniment : pas de durée à mesurer
+    if debut is None or request.endpoint == 'places_stream':
+        return response
+    etiquettes = (('route', request.endpoint or 'inconnue'), ('methode', request.method),
+                  ('statut', str(response.status_code)))
+    if response.is_streamed:
+        # Export CSV en flux : mesuré jusqu'au dernier octet envoyé
+        response.call_on_close(lambda: observer('inscription_http_requete_duree_secondes', etiquettes,
+                                                time.perf_counter() - debut))
+    else:
+        observer('inscription_http_requete_duree_secondes', etiquettes, time.perf_counter() - debut)
+    return response
+
+@before_render_template.connect_via(app)
+def debut_rendu(sender, template, context, **extra):
+    g._debut_rendu = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def fin_rendu(sender, template, context, **extra):
+    debut = g.pop('_debut_rendu', None)
+    if debut is not None:
+        observer('inscription_gabarit_rendu_duree_secondes', (('gabarit', template.name or 'inconnu'),),
+                 time.perf_counter() - debut)
+
+def _etiquettes(etiquettes, **autres):
+    paires = list(etiquettes) + list(autres.items())
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for k, v in paires)
+
+def metriques_prometheus():
+    with _metriques_lock:
+        histogrammes = sorted((cle, list(h)) for cle, h in _histogrammes.items())
+    lignes = []
+    aides = {
+        'inscription_http_requete_duree_secondes': 'Durée des requêtes HTTP par route',
+        'inscription_sqlite_requete_duree_secondes': 'Durée des execute() SQLite par type de requête',
+        'inscription_gabarit_rendu_duree_secondes': 'Durée de rendu des templates',
+    }
+    for metrique, aide in aides.items():
+        lignes.append('# HELP %s %s' % (metrique, aide))
+        lignes.append('# TYPE %s histogram' % metrique)
+        for (nom, etiquettes), h in histogrammes:
+            if nom != metrique:
+                continue
+            cumul = 0
+            for seuil, effectif in zip(HISTO_SEUILS + ('+Inf',), h[:-1]):
+                cumul += effectif
+                lignes.append('%s_bucket%s %d' % (metrique, _etiquettes(etiquettes, le=seuil), cumul))
+            lignes.append('%s_sum%s %.6f' % (metrique, _etiquettes(etiquettes), h[-1]))
+            lignes.append('%s_count%s %d' % (metrique, _etiquettes(etiquettes), cumul))
+    return lignes
+
+# Profilage d'une requête à la demande. Sans en-tête X-Profil ni activation
+# dans la session admin, le hook se résume à deux tests. Un seul profil à la
+# fois (cProfile ne supporte pas deux profileurs actifs depuis Python 3.12) :
+# une requête demandée pendant un autre profilage passe sans profil.
+_profil_lock = threading.Lock()
+_profils = collections.deque(maxlen=app.config['PROFILS_MAX'])
+_profil_ids = itertools.count(1)
+
+def profilage_demande():
+    jeton = app.config['PROFIL_JETON']
+    entete = request.headers.get('X-Profil')
+    if entete is not None:
+        return bool(jeton) and entete == jeton
+    # Sans cookie de session, ne pas toucher à session : le simple accès
+    # ajouterait « Vary: Cookie » aux réponses mises en cache (GET /, statiques)
+    if app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+        return False
+    return bool(session.get('profiler')) and 'admin' in session
+
+@app.before_request
+def demarrer_profil():
+    if not profilage_demande() or not _profil_lock.acquire(blocking=False):
+        return
+    g._profil = cProfile.Profile()
+    g._profil_debut = time.perf_counter()
+    g._profil.enable()
+
+@app.teardown_request
+def arreter_profil(exc):
+    profil = g.pop('_profil', None)
+    if profil is None:
+        return
+    try:
+        profil.disable()
+        profil.create_stats()
+        _profils.append({
+            'id': next(_profil_ids),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'methode': request.method,
+            'chemin': request.full_path.rstrip('?'),
+            'route': request.endpoint,
+            'duree_ms': round((time.perf_counter() - g.pop('_profil_debut')) * 1000, 1),
+            'erreur': repr(exc) if exc else None,
+            # Même format que Profile.dump_stats() : lisible par pstats ou snakeviz
+            'donnees': marshal.dumps(profil.stats),
+        })
+    finally:
+        _profil_lock.release()
+
+# Connexions réutilisées : chaque requête emprunte une connexion au pool
+# (pragmas déjà appliqués, requêtes préparées en cache) et la rend au
+# teardown au lieu d'ouvrir/fermer un fichier SQLite à chaque appel.
+# Les connexions sont en autocommit : les écritures ouvrent explicitement
+# leur transaction avec BEGIN IMMEDIATE.
+POOL_MAX = 8
+_pool = []
+_pool_lock = threading.Lock()
+
+def _connect():
+    conn = sqlite3.connect(DB_FILE, timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+                           isolation_level=None, check_same_thread=False, cached_statements=128,
+                           factory=ConnexionMesuree)
+    conn.execute('PRAGMA busy_timeout = %d' % app.config['SQLITE_BUSY_TIMEOUT_MS'])
+    # journal_mode est persistant dans le fichier : sans effet s'il est déjà appliqué
+    conn.execute('PRAGMA journal_mode = %s' % app.config['SQLITE_JOURNAL_MODE'])
+    conn.execute('PRAGMA synchronous = %s' % app.config['SQLITE_SYNCHRONOUS'])
+    conn.execute('PRAGMA mmap_size = %d' % app.config['SQLITE_MMAP_SIZE'])
+    conn.execute('PRAGMA cache_size = %d' % app.config['SQLITE_CACHE_SIZE'])
+    conn.execute('PRAGMA foreign_keys = ON')
+    return conn
+
+def get_db():
+    if '_db' not in g:
+        with _pool_lock:
+            conn = _pool.pop() if _pool else None
+        g._db = conn or _connect()
+    return g._db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('_db', None)
+    if conn is None:
+        return
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        if len(_pool) < POOL_MAX:
+            _pool.append(conn)
+            return
     conn.close()
-    total = (count_inscrits or 0) + (sum_accomp or 0)
-    restantes = MAX_PLACES - total
-    if restantes < 0:
+
+# Calcul des places utilisées/restantes
+# Copie en mémoire des événements et de leur compteur places_evenement.
+# PRAGMA data_version change dès qu'une autre connexion (ou un autre processus)
+# a commité une écriture : tant qu'il ne bouge pas, les valeurs en cache sont
+# encore exactes. Chaque événement est chargé à la demande par clé primaire.
+# La connexion de surveillance ne sert qu'à la lecture, sinon ses propres
+# commits ne feraient pas évoluer data_version.
+_stats_lock = threading.Lock()
+_stats_conn = None
+_stats_cache = {'version': None, 'evenements': {}, 'ouverts': None}
+
+def _cache_stats():
+    # À appeler avec _stats_lock
+    global _stats_conn
+    if _stats_conn is None:
+        _stats_conn = _connect()
+    version = _stats_conn.execute('PRAGMA data_version').fetchone()[0]
+    if version != _stats_cache['version']:
+        _stats_cache['version'] = version
+        _stats_cache['evenements'] = {}
+        _stats_cache['ouverts'] = None
+        # La page du formulaire affiche aussi titre, date, lieu et séances
+        # ouvertes : un commit d'un autre worker la rend périmée
+        _page_cache.clear()
+    return _stats_conn
+
+def get_evenement(event_id):
+    with _stats_lock:
+        conn = _cache_stats()
+        evenement = _stats_cache['evenements'].get(event_id)
+        if evenement is None:
+            # total = nombre d'inscrits + somme des accompagnants
+            row = conn.execute('''
+                SELECT e.id, e.titre, e.date, e.lieu, e.capacite, e.ouvert, p.inscrits + p.accompagnants
+                FROM evenements e JOIN places_evenement p ON p.event_id = e.id WHERE e.id = ?
+            ''', (event_id,)).fetchone()
+            if row is None:
+                return None
+            evenement = dict(zip(('id', 'titre', 'date', 'lieu', 'capacite', 'ouvert', 'total'), row))
+            _stats_cache['evenements'][event_id] = evenement
+        return evenement
+
+def evenements_ouverts():
+    with _stats_lock:
+        conn = _cache_stats()
+        if _stats_cache['ouverts'] is None:
+            _stats_cache['ouverts'] = conn.execute(
+                'SELECT id, titre FROM evenements WHERE ouvert = 1 ORDER BY id').fetchall()
+        return _stats_cache['ouverts']
+
+def evenement_par_defaut(admin=False):
+    ouverts = evenements_ouverts()
+    if ouverts:
+        return ouverts[0][0]
+    if admin:
+        # Saison terminée : les vues admin montrent le dernier événement créé
+        row = get_db().execute('SELECT MAX(id) FROM evenements').fetchone()
+        return row[0]
+    return None
+
+def get_places_stats(event_id):
+    evenement = get_evenement(event_id)
+    if evenement is None:
+        return 0, 0
+    total = evenement['total']
+    restantes = evenement['capacite'] - total
+    # Un événement fermé n'accepte plus d'inscriptions
+    if restantes < 0 or not evenement['ouvert']:
         restantes = 0
     return total, restantes
 
+# Diffusion des places restantes aux pages ouvertes (SSE). Un seul
+# surveillant par processus relit le compteur (quasi gratuit grâce au cache
+# data_version) et réveille les clients uniquement quand la valeur change ;
+# les commits locaux publient immédiatement.
+#
+# Chaque flux ouvert occupe un thread du serveur : servir l'application avec
+# des workers threadés (gunicorn --worker-class gthread --threads 32) ou
+# gevent, jamais avec des workers sync, où chaque page ouverte bloquerait un
+# worker entier et affamerait POST /. Un flux est de plus fermé au bout de
+# SSE_DUREE_MAX secondes (le navigateur se reconnecte après SSE_RECONNEXION_MS)
+# et au plus SSE_FLUX_MAX flux sont ouverts par processus ; au-delà, la page
+# fonctionne sans mise à jour en direct et réessaie plus tard.
+SSE_INTERVALLE = 1.0
+SSE_KEEPALIVE = 15.0
+SSE_DUREE_MAX = 60.0
+SSE_RECONNEXION_MS = 3000
+SSE_FLUX_MAX = 50
+_flux_ouverts = 0
+_places_cond = threading.Condition()
+_places_etat = {}  # event_id -> (version, places restantes)
+_surveillant = None
+
+def publier_places(event_id):
+    _, restantes = get_places_stats(event_id)
+    with _places_cond:
+        version, precedent = _places_etat.get(event_id, (0, None))
+        if restantes != precedent:
+            _places_etat[event_id] = (version + 1, restantes)
+            _places_cond.notify_all()
+
+def _surveiller_places():
+    while True:
+        try:
+            # Seuls les événements déjà suivis par au moins une page
+            for event_id in list(_places_etat):
+                publier_places(event_id)
+        except sqlite3.Error:
+            app.logger.exception('Lecture du compteur de places impossible')
+        time.sleep(SSE_INTERVALLE)
+
+def demarrer_surveillant():
+    global _surveillant
+    with _places_cond:
+        if _surveillant is None:
+            _surveillant = threading.Thread(target=_surveiller_places, name='surveillant-places', daemon=True)
+            _surveillant.start()
+
+def _places_restantes(c, event_id):
+    c.execute('''
+        SELECT e.capacite - p.inscrits - p.accompagnants, e.ouvert
+        FROM evenements e JOIN places_evenement p ON p.event_id = e.id WHERE e.id = ?
+    ''', (event_id,))
+    row = c.fetchone()
+    if row is None or not row[1]:
+        return 0
+    return row[0]
+
+INSERT_INSCRIPTION = '''
+    INSERT INTO inscriptions (event_id, nom, prenom, email, laboratoire, accompagnants, commentaire, nom_norm, prenom_norm)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (event_id, nom_norm, prenom_norm) DO NOTHING
+'''
+
+# Places accessibles à un laboratoire : places restantes de l'événement, moins
+# les places encore réservées aux autres laboratoires, dans la limite de son
+# propre quota. Lectures par clé sur quotas_labo/places_labo (au plus une ligne
+# par laboratoire), indépendantes du nombre d'inscriptions.
+def _places_disponibles(c, event_id, laboratoire, places_restantes):
+    c.execute('''
+        SELECT COALESCE(SUM(MAX(q.reserve - COALESCE(p.places, 0), 0)), 0)
+        FROM quotas_labo q LEFT JOIN places_labo p ON p.event_id = q.event_id AND p.laboratoire = q.laboratoire
+        WHERE q.event_id = ? AND q.laboratoire != ?
+    ''', (event_id, laboratoire))
+    disponibles = places_restantes - c.fetchone()[0]
+    c.execute('''
+        SELECT q.quota, COALESCE(p.places, 0)
+        FROM quotas_labo q LEFT JOIN places_labo p ON p.event_id = q.event_id AND p.laboratoire = q.laboratoire
+        WHERE q.event_id = ? AND q.laboratoire = ?
+    ''', (event_id, laboratoire))
+    row = c.fetchone()
+    if row is not None and row[0] is not None:
+        disponibles = min(disponibles, row[0] - row[1])
+    return disponibles
+
+class DejaInscrit(Exception):
+    pass
+
+# Soumission déjà traitée : porte le résultat d'origine
+class DejaSoumis(Exception):
+    def __init__(self, statut, accomp_demandes, accompagnants):
+        super().__init__(statut)
+        self.statut = statut
+        self.accomp_demandes = accomp_demandes
+        self.accompagnants = accompagnants
+
+SOUMISSION_DUREE = 24 * 3600  # durée de conservation des jetons, en secondes
+JETON_MAX = 64
+
+def _verifier_jeton(c, jeton):
+    if not jeton:
+        return
+    c.execute('SELECT statut, accomp_demandes, accompagnants FROM soumissions WHERE jeton = ?', (jeton,))
+    row = c.fetchone()
+    if row is not None:
+        c.execute('ROLLBACK')
+        raise DejaSoumis(*row)
+
+def _enregistrer_jeton(c, jeton, event_id, statut, accomp_demandes, accompagnants):
+    if not jeton:
+        return
+    maintenant = time.time()
+    c.execute('INSERT INTO soumissions (jeton, event_id, statut, accomp_demandes, accompagnants, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+              (jeton, event_id, statut, accomp_demandes, accompagnants, maintenant))
+    c.execute('DELETE FROM soumissions WHERE created_at < ?', (maintenant - SOUMISSION_DUREE,))
+
+class QuotaLaboAtteint(Exception):
+    pass
+
+class EvenementFerme(Exception):
+    pass
+
+# Réservation atomique : vérification de la capacité, ajustement des
+# accompagnants et insertion dans une seule transaction. BEGIN IMMEDIATE
+# prend le verrou d'écriture dès le départ, donc deux requêtes concurrentes
+# ne peuvent pas lire le même nombre de places restantes. Tant que la liste
+# d'attente n'est pas vide, on renvoie None : le nouvel arrivant passe par
+# inscrire_attente, derrière les personnes qui attendent déjà.
+def reserver_place(event_id, nom, prenom, email, laboratoire, accomp_demandes, commentaire, jeton=None):
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        _verifier_jeton(c, jeton)
+        places_restantes = _places_restantes(c, event_id)
+        if places_restantes <= 0:
+            c.execute('ROLLBACK')
+            return None
+        disponibles = _places_disponibles(c, event_id, laboratoire, places_restantes)
+        if disponibles <= 0:
+            c.execute('ROLLBACK')
+            raise QuotaLaboAtteint()
+        c.execute('SELECT 1 FROM liste_attente WHERE event_id = ? LIMIT 1', (event_id,))
+        if c.fetchone() is not None:
+            c.execute('ROLLBACK')
+            return None
+        # On garantit 1 place pour le salarié, les accompagnants sont limités au reste
+        accompagnants = min(accomp_demandes, disponibles - 1)
+        c.execute(INSERT_INSCRIPTION, (event_id, nom, prenom, email, laboratoire, accompagnants, commentaire,
+                                       normaliser_nom(nom), normaliser_nom(prenom)))
+        if c.rowcount == 0:
+            # Conflit sur l'index UNIQUE : rien n'a été inséré
+            c.execute('ROLLBACK')
+            raise DejaInscrit()
+        _enregistrer_jeton(c, jeton, event_id, 'inscrit', accomp_demandes, accompagnants)
+        c.execute('COMMIT')
+        _page_cache.clear()
+        publier_places(event_id)
+        return accompagnants
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+# Première entrée de chaque laboratoire en liste d'attente, par un parcours
+# de l'index (event_id, laboratoire, id) qui saute d'un laboratoire au suivant
+TETES_ATTENTE = '''
+    WITH RECURSIVE labos(laboratoire) AS (
+        SELECT MIN(laboratoire) FROM liste_attente WHERE event_id = :event_id
+        UNION ALL
+        SELECT (SELECT MIN(laboratoire) FROM liste_attente WHERE event_id = :event_id AND laboratoire > labos.laboratoire)
+        FROM labos WHERE labos.laboratoire IS NOT NULL
+    )
+    SELECT laboratoire, (SELECT MIN(id) FROM liste_attente WHERE event_id = :event_id AND laboratoire = labos.laboratoire)
+    FROM labos WHERE laboratoire IS NOT NULL
+'''
+
+# Promotion de la liste d'attente, à appeler dans une transaction d'écriture
+# dès que des places se libèrent. Les entrées sont servies dans l'ordre
+# d'arrivée ; celles dont le laboratoire a atteint son quota sont sautées
+# (elles gardent leur rang) au lieu de bloquer les suivantes. On ne lit que
+# la tête de file de chaque laboratoire (index (event_id, laboratoire, id)) :
+# le coût dépend du nombre de laboratoires et d'entrées promues, pas de la
+# longueur de la liste. Les places ne font que diminuer pendant la boucle :
+# un laboratoire bloqué le reste.
+# Renvoie [(id en liste d'attente, accompagnants enregistrés)].
+def _promouvoir_attente(c, event_id):
+    promus = []
+    places_restantes = _places_restantes(c, event_id)
+    if places_restantes <= 0:
+        return promus
+    c.execute(TETES_ATTENTE, {'event_id': event_id})
+    tetes = dict(c.fetchall())  # laboratoire -> id de sa première entrée
+    while places_restantes > 0 and tetes:
+        laboratoire, attente_id = min(tetes.items(), key=lambda tete: tete[1])
+        disponibles = _places_disponibles(c, event_id, laboratoire, places_restantes)
+        if disponibles <= 0:
+            del tetes[laboratoire]
+            continue
+        c.execute('''
+            SELECT nom, prenom, email, accompagnants, commentaire, nom_norm, prenom_norm
+            FROM liste_attente WHERE id = ?
+        ''', (attente_id,))
+        nom, prenom, email, accomp_demandes, commentaire, nom_norm, prenom_norm = c.fetchone()
+        accompagnants = min(accomp_demandes, disponibles - 1)
+        c.execute(INSERT_INSCRIPTION, (event_id, nom, prenom, email, laboratoire, accompagnants, commentaire,
+                                       nom_norm, prenom_norm))
+        insere = c.rowcount
+        c.execute('DELETE FROM liste_attente WHERE id = ?', (attente_id,))
+        c.execute('SELECT MIN(id) FROM liste_attente WHERE event_id = ? AND laboratoire = ? AND id > ?',
+                  (event_id, laboratoire, attente_id))
+        suivant = c.fetchone()[0]
+        if suivant is None:
+            del tetes[laboratoire]
+        else:
+            tetes[laboratoire] = suivant
+        # Rien d'inséré : déjà inscrit entre-temps, l'entrée est simplement retirée
+        if insere:
+            promus.append((attente_id, accompagnants))
+            places_restantes = _places_restantes(c, event_id)
+    return promus
+
+# Inscription sur liste d'attente quand l'événement est complet. Les places
+# ont pu se libérer depuis le refus : on tente aussitôt une promotion dans la
+# même transaction. Renvoie None si la personne attend, sinon le nombre
+# d'accompagnants enregistrés.
+def inscrire_attente(event_id, nom, prenom, email, laboratoire, accomp_demandes, commentaire, jeton=None):
+    nom_norm, prenom_norm = normaliser_nom(nom), normaliser_nom(prenom)
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        _verifier_jeton(c, jeton)
+        # Événement fermé : une entrée en attente ne serait jamais promue
+        c.execute('SELECT ouvert FROM evenements WHERE id = ?', (event_id,))
+        row = c.fetchone()
+        if row is None or not row[0]:
+            c.execute('ROLLBACK')
+            raise EvenementFerme()
+        c.execute('SELECT 1 FROM inscriptions WHERE event_id = ? AND nom_norm = ? AND prenom_norm = ?',
+                  (event_id, nom_norm, prenom_norm))
+        if c.fetchone() is not None:
+            c.execute('ROLLBACK')
+            raise DejaInscrit()
+        c.execute('''
+            INSERT INTO liste_attente (event_id, nom, prenom, email, laboratoire, accompagnants, commentaire, nom_norm, prenom_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (event_id, nom_norm, prenom_norm) DO NOTHING
+        ''', (event_id, nom, prenom, email, laboratoire, accomp_demandes, commentaire, nom_norm, prenom_norm))
+        if c.rowcount == 0:
+            c.execute('ROLLBACK')
+            raise DejaInscrit()
+        attente_id = c.lastrowid
+        promus = dict(_promouvoir_attente(c, event_id))
+        if attente_id in promus:
+            _enregistrer_jeton(c, jeton, event_id, 'inscrit', accomp_demandes, promus[attente_id])
+        else:
+            _enregistrer_jeton(c, jeton, event_id, 'attente', accomp_demandes, None)
+        c.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    if promus:
+        _page_cache.clear()
+        publier_places(event_id)
+    return promus.get(attente_id)
+
+# Suppression d'une inscription ou baisse de ses accompagnants (admin) : les
+# places libérées profitent à la liste d'attente dans la même transaction.
+def liberer_places(inscription_id, accompagnants=None):
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT event_id, accompagnants FROM inscriptions WHERE id = ?', (inscription_id,))
+        row = c.fetchone()
+        if row is None:
+            c.execute('ROLLBACK')
+            return None
+        event_id, actuels = row
+        if accompagnants is None:
+            c.execute('DELETE FROM inscriptions WHERE id = ?', (inscription_id,))
+        else:
+            # Uniquement à la baisse : une hausse passerait outre la capacité
+            c.execute('UPDATE inscriptions SET accompagnants = ? WHERE id = ?',
+                      (max(0, min(accompagnants, actuels or 0)), inscription_id))
+        promus = _promouvoir_attente(c, event_id)
+        c.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    _page_cache.clear()
+    publier_places(event_id)
+    return event_id, promus
+
+# Inscription en lot (API admin) : mêmes règles que le formulaire, appliquées
+# ligne par ligne dans l'ordre du lot, dans une seule transaction. Les
+# doublons sont détectés par l'index UNIQUE (ON CONFLICT DO NOTHING), d'où une
+# insertion par ligne plutôt qu'un executemany. Renvoie un résultat par ligne.
+CHAMPS_LOT = ['nom', 'prenom', 'email', 'laboratoire', 'accompagnants', 'commentaire']
+
+def valider_ligne(ligne):
+    erreurs = []
+    if not isinstance(ligne, dict):
+        return None, ['ligne invalide']
+    valeurs = {champ: str(ligne.get(champ) or '').strip() for champ in CHAMPS_LOT}
+    for champ in ('nom', 'prenom', 'email'):
+        if not valeurs[champ]:
+            erreurs.append('%s manquant' % champ)
+    if valeurs['laboratoire'] not in LABS:
+        erreurs.append('laboratoire inconnu')
+    try:
+        valeurs['accompagnants'] = max(0, int(valeurs['accompagnants'] or 0))
+    except ValueError:
+        erreurs.append('accompagnants invalide')
+    return valeurs, erreurs
+
+def inscrire_lot(event_id, lignes):
+    resultats = []
+    inscrits = 0
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        places_restantes = _places_restantes(c, event_id)
+        for numero, ligne in enumerate(lignes, start=1):
+            valeurs, erreurs = valider_ligne(ligne)
+            if erreurs:
+                resultats.append({'ligne': numero, 'statut': 'invalide', 'erreurs': erreurs})
+                continue
+            if places_restantes <= 0:
+                resultats.append({'ligne': numero, 'statut': 'complet'})
+                continue
+            disponibles = _places_disponibles(c, event_id, valeurs['laboratoire'], places_restantes)
+            if disponibles <= 0:
+                resultats.append({'ligne': numero, 'statut': 'quota_labo'})
+                continue
+            accompagnants = min(valeurs['accompagnants'], disponibles - 1)
+            c.execute(INSERT_INSCRIPTION, (event_id, valeurs['nom'], valeurs['prenom'], valeurs['email'],
+                                           valeurs['laboratoire'], accompagnants, valeurs['commentaire'],
+                                           normaliser_nom(valeurs['nom']), normaliser_nom(valeurs['prenom'])))
+            if c.rowcount == 0:
+                resultats.append({'ligne': numero, 'statut': 'deja_inscrit'})
+                continue
+            places_restantes -= 1 + accompagnants
+            inscrits += 1
+            resultats.append({'ligne': numero, 'statut': 'inscrit',
+                              'accompagnants_demandes': valeurs['accompagnants'],
+                              'accompagnants': accompagnants})
+        c.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    if inscrits:
+        _page_cache.clear()
+        publier_places(event_id)
+    return resultats, inscrits, max(places_restantes, 0)
+
 FORM_HTML = """
 <!doctype html>
 <title>Inscription</title>
-<h2>Formulaire d'inscription Badmington 28/09/2025</h2>
-<p><strong>Lieu :</strong> Gymnase du lycée Val de Seine, 5–11 Avenue Georges Braque, 76120 Le Grand-Quevilly<br>
-<strong>Date :</strong> Dimanche 28/09/2025 matin</p>
+<h2>Formulaire d'inscription{% if evenement %} {{ evenement.titre }}{% endif %}</h2>
+{% if not evenement %}
+<p>Aucune séance n'est ouverte aux inscriptions pour le moment. Revenez bientôt !</p>
+{% else %}
+{% if ouverts|length > 1 %}
+<p>Autres séances :
+{% for id, titre in ouverts if id != evenement.id %}
+<a href="{{ url_for('inscription', evenement=id) }}">{{ titre }}</a>{% if not loop.last %} · {% endif %}
+{% endfor %}
+</p>
+{% endif %}
+<p><strong>Lieu :</strong> {{ evenement.lieu }}<br>
+<strong>Date :</strong> {{ evenement.date }}</p>
 <img src="{{ url_for('static', filename='badmington.jpg') }}" alt="Badminton" style="max-width:300px; display:block; margin-bottom:15px;">
-<p><strong>Places restantes : {{ places_restantes }}</strong></p>
-{% if complet %}
-<p style="color:red; font-weight:bold;">Complet – il n'y a plus de places disponibles.</p>
+<p><strong>Places restantes : <span id="places">{{ places_restantes }}</span></strong></p>
+{% if erreur %}
+<p style="color:red;">{{ erreur }}</p>
 {% endif %}
+<p id="complet" style="color:red; font-weight:bold;" {% if not complet %}hidden{% endif %}>Complet – il n'y a plus de places disponibles. Vous pouvez vous inscrire sur la liste d'attente : les places libérées sont attribuées dans l'ordre d'arrivée.</p>
 <form method="post">
+    <input type="hidden" id="jeton" name="jeton" value="">
     <label>Nom: <input type="text" name="nom" required></label><br>
     <label>Prénom: <input type="text" name="prenom" required></label><br>
     <label>Email: <input type="email" name="email" required></label><br>
@@ -107,10 +1037,39 @@ FORM_HTML = """
             <option value="QG">QG</option>
         </select>
     </label><br>
-    <label>Nombre d'accompagnants (optionnel, priorité aux salariés): <input type="number" name="accompagnants" min="0" value="0" max="{{ max_accomp }}"></label><br>
+    <label>Nombre d'accompagnants (optionnel, priorité aux salariés): <input type="number" id="accompagnants" name="accompagnants" min="0" value="0" max="{{ max_accomp }}"></label><br>
     <label>Commentaire: <textarea name="commentaire"></textarea></label><br>
-    <button type="submit" {% if complet %}disabled{% endif %}>S'inscrire</button>
+    <button type="submit" id="inscrire">{% if complet %}S'inscrire sur la liste d'attente{% else %}S'inscrire{% endif %}</button>
 </form>
+<script>
+// Jeton de soumission unique, généré par le navigateur pour que la page reste
+// identique pour tous (cache + ETag) : un double envoi réutilise le même jeton
+document.getElementById('jeton').value = (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID()
+    : Date.now().toString(36) + Math.random().toString(36).slice(2);
+// Mise à jour en direct des places restantes (Server-Sent Events)
+// Le serveur ferme le flux régulièrement (reconnexion automatique) ; s'il
+// refuse (trop de flux ouverts), on réessaie dans 30 s
+function suivrePlaces() {
+    var source = new EventSource("{{ url_for('places_stream', evenement=evenement.id) }}");
+    source.onmessage = function (e) {
+        var restantes = parseInt(e.data, 10);
+        document.getElementById('places').textContent = restantes;
+        document.getElementById('accompagnants').max = Math.max(0, restantes - 1);
+        document.getElementById('inscrire').textContent = restantes > 0 ? "S'inscrire" : "S'inscrire sur la liste d'attente";
+        document.getElementById('complet').hidden = restantes > 0;
+    };
+    source.onerror = function () {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(suivrePlaces, 30000);
+        }
+    };
+}
+if (window.EventSource) {
+    suivrePlaces();
+}
+</script>
+{% endif %}
 <br>
 <img src="{{ url_for('static', filename='plan.png') }}" alt="Plan" style="max-width:400px; display:block; margin-top:15px;">
 <img src="{{ url_for('static', filename='acces.png') }}" alt="Accès" style="max-width:400px; display:block; margin-top:15px;">
@@ -119,11 +1078,16 @@ FORM_HTML = """
 CONFIRM_HTML = """
 <!doctype html>
 <title>Confirmation</title>
+{% if attente %}
+<h2>Vous êtes sur la liste d'attente</h2>
+<p>L'événement est complet. Votre inscription sera enregistrée automatiquement, dans l'ordre d'arrivée, si des places se libèrent.</p>
+{% else %}
 <h2>Merci pour votre inscription !</h2>
 {% if accomp_initial is not none and accomp_enregistre is not none and accomp_enregistre < accomp_initial %}
 <p>Note : vous aviez demandé {{ accomp_initial }} accompagnant(s), mais seulement {{ accomp_enregistre }} a/ont été enregistré(s) en fonction des places restantes (priorité aux salariés).</p>
 {% endif %}
-<p><a href="{{ url_for('inscription') }}">Retour au formulaire</a></p>
+{% endif %}
+<p><a href="{{ url_for('inscription', evenement=event_id) }}">Retour au formulaire</a></p>
 """
 
 LOGIN_HTML = """
@@ -148,8 +1112,28 @@ LOGIN_HTML = """
 LISTE_HTML = """
 <!doctype html>
 <title>Liste des inscrits</title>
-<h2>Liste des inscrits</h2>
+<h2>Liste des inscrits — {{ evenement.titre }}</h2>
 <p><strong>Capacité : {{ max_places }} — Inscrits (avec accompagnants) : {{ total_places }} — Restantes : {{ places_restantes }}</strong></p>
+<form method="get">
+    <label>Événement:
+        <select name="evenement">
+            {% for ev in evenements %}
+            <option value="{{ ev[0] }}" {% if ev[0] == evenement.id %}selected{% endif %}>{{ ev[1] }}{% if not ev[2] %} (fermé){% endif %}</option>
+            {% endfor %}
+        </select>
+    </label>
+    <label>Laboratoire:
+        <select name="labo">
+            <option value="">Tous</option>
+            {% for lab in labs %}
+            <option value="{{ lab }}" {% if lab == labo %}selected{% endif %}>{{ lab }}</option>
+            {% endfor %}
+        </select>
+    </label>
+    <label>Nom commençant par: <input type="text" name="nom" value="{{ nom }}"></label>
+    <label>Par page: <input type="number" name="taille" min="1" max="{{ taille_max }}" value="{{ taille }}"></label>
+    <button type="submit">Filtrer</button>
+</form>
 <table border="1" cellpadding="5">
     <tr>
         <th>ID</th>
@@ -159,6 +1143,7 @@ LISTE_HTML = """
         <th>Laboratoire</th>
         <th>Accompagnants</th>
         <th>Commentaire</th>
+        <th>Actions</th>
     </tr>
     {% for ins in inscriptions %}
     <tr>
@@ -169,18 +1154,274 @@ LISTE_HTML = """
         <td>{{ ins[4] }}</td>
         <td>{{ ins[5] }}</td>
         <td>{{ ins[6] }}</td>
+        <td>
+            <form method="post" action="{{ url_for('admin_accompagnants', inscription_id=ins[0]) }}" style="display:inline;">
+                <input type="number" name="accompagnants" min="0" max="{{ ins[5] or 0 }}" value="{{ ins[5] or 0 }}" style="width:4em;">
+                <button type="submit">Réduire</button>
+            </form>
+            <form method="post" action="{{ url_for('admin_supprimer', inscription_id=ins[0]) }}" style="display:inline;"
+                  onsubmit="return confirm('Supprimer cette inscription ?');">
+                <button type="submit">Supprimer</button>
+            </form>
+        </td>
+    </tr>
+    {% endfor %}
+</table>
+<p>
+{% if avant %}<a href="{{ url_for('liste', evenement=evenement.id, labo=labo, nom=nom, taille=taille) }}">Première page</a>{% endif %}
+{% if suivant %}<a href="{{ url_for('liste', evenement=evenement.id, labo=labo, nom=nom, taille=taille, avant=suivant) }}">Page suivante</a>{% endif %}
+</p>
+<h3>Liste d'attente ({{ attente_total }})</h3>
+{% if attente %}
+<table border="1" cellpadding="5">
+    <tr>
+        <th>Rang</th>
+        <th>Nom</th>
+        <th>Prénom</th>
+        <th>Email</th>
+        <th>Laboratoire</th>
+        <th>Accompagnants</th>
+        <th>Depuis</th>
+    </tr>
+    {% for att in attente %}
+    <tr>
+        <td>{{ loop.index }}</td>
+        <td>{{ att[0] }}</td>
+        <td>{{ att[1] }}</td>
+        <td>{{ att[2] }}</td>
+        <td>{{ att[3] }}</td>
+        <td>{{ att[4] }}</td>
+        <td>{{ att[5] }}</td>
+    </tr>
+    {% endfor %}
+</table>
+{% endif %}
+<h3>Quotas par laboratoire</h3>
+<form method="post" action="{{ url_for('admin_quotas', evenement=evenement.id) }}">
+<table border="1" cellpadding="5">
+    <tr>
+        <th>Laboratoire</th>
+        <th>Places prises</th>
+        <th>Quota (vide = aucun)</th>
+        <th>Places réservées</th>
+    </tr>
+    {% for q in quotas %}
+    <tr>
+        <td>{{ q.laboratoire }}</td>
+        <td>{{ q.places }}{% if q.quota is not none %} / {{ q.quota }}{% endif %}</td>
+        <td><input type="number" name="quota_{{ q.laboratoire }}" min="0" value="{{ q.quota if q.quota is not none else '' }}"></td>
+        <td><input type="number" name="reserve_{{ q.laboratoire }}" min="0" value="{{ q.reserve }}"></td>
     </tr>
     {% endfor %}
 </table>
+<button type="submit">Enregistrer les quotas</button>
+</form>
 <p><a href="{{ url_for('logout') }}">Déconnexion</a>
-<br><a href="{{ url_for('export_csv') }}">Exporter en CSV</a>
+<br><a href="{{ url_for('export_csv', evenement=evenement.id) }}">Exporter en CSV</a>
+<br><a href="{{ url_for('admin_evenements') }}">Gérer les événements</a>
 </p>
 """
 
+EVENEMENTS_HTML = """
+<!doctype html>
+<title>Événements</title>
+<h2>Événements</h2>
+<table border="1" cellpadding="5">
+    <tr>
+        <th>ID</th>
+        <th>Titre</th>
+        <th>Date</th>
+        <th>Lieu</th>
+        <th>Capacité</th>
+        <th>Ouvert</th>
+        <th></th>
+    </tr>
+    {% for ev in evenements %}
+    <tr>
+        <form method="post">
+        <td>{{ ev[0] }}<input type="hidden" name="id" value="{{ ev[0] }}"></td>
+        <td><input type="text" name="titre" value="{{ ev[1] }}" required></td>
+        <td><input type="text" name="date" value="{{ ev[2] or '' }}"></td>
+        <td><input type="text" name="lieu" value="{{ ev[3] or '' }}"></td>
+        <td><input type="number" name="capacite" min="0" value="{{ ev[4] }}" required></td>
+        <td><input type="checkbox" name="ouvert" value="1" {% if ev[5] %}checked{% endif %}></td>
+        <td><button type="submit">Enregistrer</button> <a href="{{ url_for('liste', evenement=ev[0]) }}">Inscrits</a></td>
+        </form>
+    </tr>
+    {% endfor %}
+    <tr>
+        <form method="post">
+        <td>Nouveau</td>
+        <td><input type="text" name="titre" required></td>
+        <td><input type="text" name="date"></td>
+        <td><input type="text" name="lieu"></td>
+        <td><input type="number" name="capacite" min="0" value="{{ max_places }}" required></td>
+        <td><input type="checkbox" name="ouvert" value="1" checked></td>
+        <td><button type="submit">Créer</button></td>
+        </form>
+    </tr>
+</table>
+<p><a href="{{ url_for('liste') }}">Retour à la liste</a></p>
+"""
+
+# Templates compilés une seule fois à l'import ; render_template accepte
+# directement un objet Template et lui fournit le contexte Flask habituel
+# (url_for, get_flashed_messages, session...). Le nom sert d'étiquette aux
+# métriques de rendu.
+def compiler_template(nom, source):
+    template = app.jinja_env.from_string(source)
+    template.name = nom
+    return template
+
+FORM_TEMPLATE = compiler_template('formulaire', FORM_HTML)
+CONFIRM_TEMPLATE = compiler_template('confirmation', CONFIRM_HTML)
+LOGIN_TEMPLATE = compiler_template('connexion', LOGIN_HTML)
+LISTE_TEMPLATE = compiler_template('liste', LISTE_HTML)
+EVENEMENTS_TEMPLATE = compiler_template('evenements', EVENEMENTS_HTML)
+
+def evenement_demande(source, admin=False):
+    event_id = source.get('evenement', type=int) or evenement_par_defaut(admin)
+    evenement = get_evenement(event_id) if event_id else None
+    if evenement is None:
+        abort(404)
+    return evenement
+
+# Contrôle d'admission : plutôt que de laisser les POST / s'empiler derrière
+# le verrou d'écriture SQLite, on refuse tout de suite l'excédent avec une page
+# légère (429 + Retry-After). Chaque IP dispose d'un seau de ADMISSION_RAFALE_IP
+# jetons rechargé à ADMISSION_DEBIT_IP par seconde, et au plus
+# ADMISSION_CONCURRENCE_MAX inscriptions sont traitées en même temps.
+_admission_lock = threading.Lock()
+_seaux = collections.OrderedDict()  # ip -> (jetons, instant de la dernière recharge), du moins récent au plus récent
+SEAUX_MAX = 10000
+_en_cours = 0
+_admission_stats = {'admis': 0, 'refus_debit': 0, 'refus_concurrence': 0}
+
+RETRY_HTML = """<!doctype html>
+<title>Réessayez dans un instant</title>
+<h2>Beaucoup de demandes en ce moment</h2>
+<p>Merci de réessayer dans %d seconde(s).</p>
+<script>setTimeout(function () { history.back(); }, %d);</script>
+"""
+
+def _prendre_jeton(ip, maintenant):
+    """Consomme un jeton du seau de l'IP ; renvoie le délai d'attente sinon."""
+    debit = app.config['ADMISSION_DEBIT_IP']
+    rafale = app.config['ADMISSION_RAFALE_IP']
+    jetons, instant = _seaux.pop(ip, (rafale, maintenant))
+    jetons = min(rafale, jetons + (maintenant - instant) * debit)
+    attente = 0 if jetons >= 1 else ((1 - jetons) / debit if debit > 0 else 60)
+    # Réinsertion en fin : l'ordre du dictionnaire est celui du dernier passage
+    _seaux[ip] = (jetons - 1 if not attente else jetons, maintenant)
+    while len(_seaux) > SEAUX_MAX:
+        # On oublie les IP vues il y a le plus longtemps : leur seau s'est
+        # (presque) rempli depuis, l'oublier ne leur donne guère plus
+        _seaux.popitem(last=False)
+    return attente
+
+@app.before_request
+def admettre_inscription():
+    global _en_cours
+    if request.method != 'POST' or request.endpoint != 'inscription':
+        return None
+    with _admission_lock:
+        attente = _prendre_jeton(request.remote_addr or '', time.monotonic())
+        if attente:
+            _admission_stats['refus_debit'] += 1
+        elif _en_cours >= app.config['ADMISSION_CONCURRENCE_MAX']:
+            _admission_stats['refus_concurrence'] += 1
+            attente = 1
+        else:
+            _en_cours += 1
+            _admission_stats['admis'] += 1
+            g._admis = True
+            return None
+    secondes = max(1, int(attente + 0.999))
+    return Response(RETRY_HTML % (secondes, secondes * 1000), status=429,
+                    headers={'Retry-After': str(secondes)})
+
+@app.teardown_request
+def liberer_admission(exc):
+    global _en_cours
+    if g.pop('_admis', False):
+        with _admission_lock:
+            _en_cours -= 1
+
+def admission_stats():
+    with _admission_lock:
+        return dict(_admission_stats, en_cours=_en_cours, ips_suivies=len(_seaux))
+
+@app.route('/admin/admission')
+def admission():
+    if 'admin' not in session:
+        return jsonify({'erreur': 'authentification requise'}), 401
+    return jsonify(admission_stats())
+
+@app.route('/admin/profils', methods=['GET', 'POST'])
+def profils():
+    if 'admin' not in session:
+        return jsonify({'erreur': 'authentification requise'}), 401
+    if request.method == 'POST':
+        # Active/désactive le profilage des prochaines requêtes de cette session
+        session['profiler'] = request.form.get('actif') == '1'
+    return jsonify({
+        'actif': bool(session.get('profiler')),
+        'profils': [dict({k: v for k, v in p.items() if k != 'donnees'},
+                         url=url_for('profil_telecharger', profil_id=p['id']))
+                    for p in reversed(_profils)],
+    })
+
+TRIS_PROFIL = {cle.value for cle in pstats.SortKey}
+
+@app.route('/admin/profils/<int:profil_id>')
+def profil_telecharger(profil_id):
+    if 'admin' not in session:
+        return jsonify({'erreur': 'authentification requise'}), 401
+    profil = next((p for p in list(_profils) if p['id'] == profil_id), None)
+    if profil is None:
+        abort(404)
+    if request.args.get('format') == 'texte':
+        # Résumé lisible : fonctions triées par temps cumulé
+        sortie = io.StringIO()
+        stats = pstats.Stats(stream=sortie)
+        stats.stats = marshal.loads(profil['donnees'])
+        stats.get_top_level_stats()
+        tri = request.args.get('tri', 'cumulative')
+        if tri not in TRIS_PROFIL:
+            tri = 'cumulative'
+        stats.sort_stats(tri).print_stats(request.args.get('lignes', 40, type=int))
+        return Response(sortie.getvalue(), mimetype='text/plain')
+    response = Response(profil['donnees'], mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = 'attachment; filename=profil-%d.prof' % profil_id
+    return response
+
+@app.route('/metrics')
+def metrics():
+    jeton = app.config['METRIQUES_JETON']
+    if 'admin' not in session and not (jeton and request.headers.get('Authorization') == 'Bearer ' + jeton):
+        return Response('authentification requise\n', status=401, mimetype='text/plain')
+    lignes = metriques_prometheus()
+    stats = admission_stats()
+    lignes.append("# HELP inscription_admission_total Décisions du contrôle d'admission de POST /")
+    lignes.append('# TYPE inscription_admission_total counter')
+    for decision in ('admis', 'refus_debit', 'refus_concurrence'):
+        lignes.append('inscription_admission_total{decision="%s"} %d' % (decision, stats[decision]))
+    lignes.append('# HELP inscription_admission_en_cours Inscriptions en cours de traitement')
+    lignes.append('# TYPE inscription_admission_en_cours gauge')
+    lignes.append('inscription_admission_en_cours %d' % stats['en_cours'])
+    lignes.append('# HELP inscription_pool_connexions Connexions SQLite libres dans le pool')
+    lignes.append('# TYPE inscription_pool_connexions gauge')
+    lignes.append('inscription_pool_connexions %d' % len(_pool))
+    return Response('\n'.join(lignes) + '\n', mimetype='text/plain; version=0.0.4')
+
 @app.route('/', methods=['GET', 'POST'])
 def inscription():
-    total, places_restantes = get_places_stats()
-    complet = places_restantes <= 0
+    if not request.args.get('evenement', type=int) and evenement_par_defaut() is None:
+        # Aucune séance ouverte (fin de saison) : une page plutôt qu'une 404
+        return render_template(FORM_TEMPLATE, evenement=None, ouverts=[], places_restantes=0, max_accomp=0,
+                               complet=True)
+    evenement = evenement_demande(request.args)
+    event_id = evenement['id']
     if request.method == 'POST':
         nom = request.form.get('nom', '').strip()
         prenom = request.form.get('prenom', '').strip()
@@ -192,27 +1433,106 @@ def inscription():
             accomp_demandes = max(0, int(accomp_str))
         except ValueError:
             accomp_demandes = 0
-        # Recalcule des places restantes pour éviter une course entre requêtes
-        _, places_restantes = get_places_stats()
-        if places_restantes <= 0:
-            # Plus de place du tout
-            return render_template_string(FORM_HTML, places_restantes=0, max_accomp=0, complet=True)
-        # On garantit 1 place pour le salarié, les accompagnants sont limités au reste
-        max_pour_accomp = max(0, places_restantes - 1)
-        accompagnants = min(accomp_demandes, max_pour_accomp)
         commentaire = request.form.get('commentaire', '').strip()
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute('INSERT INTO inscriptions (nom, prenom, email, laboratoire, accompagnants, commentaire) VALUES (?, ?, ?, ?, ?, ?)',
-                  (nom, prenom, email, laboratoire, accompagnants, commentaire))
-        conn.commit()
-        conn.close()
-        return render_template_string(CONFIRM_HTML, accomp_initial=accomp_demandes, accomp_enregistre=accompagnants)
+        jeton = request.form.get('jeton', '').strip()[:JETON_MAX] or None
+        try:
+            accompagnants = reserver_place(event_id, nom, prenom, email, laboratoire, accomp_demandes, commentaire, jeton)
+            if accompagnants is None:
+                # Plus de place du tout, ou des personnes attendent déjà : liste d'attente
+                accompagnants = inscrire_attente(event_id, nom, prenom, email, laboratoire, accomp_demandes, commentaire, jeton)
+                if accompagnants is None:
+                    return render_template(CONFIRM_TEMPLATE, event_id=event_id, attente=True)
+        except DejaSoumis as e:
+            # Renvoi du même formulaire : on réaffiche la confirmation d'origine
+            return render_template(CONFIRM_TEMPLATE, event_id=event_id, attente=e.statut == 'attente',
+                                   accomp_initial=e.accomp_demandes, accomp_enregistre=e.accompagnants)
+        except (DejaInscrit, QuotaLaboAtteint, EvenementFerme) as e:
+            if isinstance(e, DejaInscrit):
+                erreur = "Cette personne est déjà inscrite. Si vous devez modifier votre inscription, contactez l'organisateur."
+            elif isinstance(e, EvenementFerme):
+                erreur = "Les inscriptions à cette séance sont fermées."
+            else:
+                erreur = "Il n'y a plus de places disponibles pour le laboratoire %s." % laboratoire
+            _, places_restantes = get_places_stats(event_id)
+            return render_template(FORM_TEMPLATE, evenement=evenement, ouverts=evenements_ouverts(),
+                                   places_restantes=places_restantes, max_accomp=max(0, places_restantes - 1),
+                                   complet=places_restantes <= 0, erreur=erreur)
+        return render_template(CONFIRM_TEMPLATE, event_id=event_id, accomp_initial=accomp_demandes, accomp_enregistre=accompagnants)
     # GET : afficher formulaire avec places restantes et limite dynamique pour accompagnants
-    total, places_restantes = get_places_stats()
-    complet = places_restantes <= 0
-    max_accomp = max(0, places_restantes - 1)
-    return render_template_string(FORM_HTML, places_restantes=places_restantes, max_accomp=max_accomp, complet=complet)
+    total, places_restantes = get_places_stats(event_id)
+    body, etag = page_formulaire(evenement, places_restantes)
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    # Le navigateur doit revalider à chaque fois, mais reçoit un 304 tant
+    # que le nombre de places n'a pas changé
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# Cache du formulaire rendu : la page ne dépend que de l'événement et de
+# ses places restantes ; vidé par les commits locaux et, via _cache_stats(),
+# dès que PRAGMA data_version signale un commit d'un autre processus
+_page_cache = {}
+
+def page_formulaire(evenement, places_restantes):
+    cle = (evenement['id'], places_restantes)
+    cached = _page_cache.get(cle)
+    if cached is None:
+        complet = places_restantes <= 0
+        max_accomp = max(0, places_restantes - 1)
+        body = render_template(FORM_TEMPLATE, evenement=evenement, ouverts=evenements_ouverts(),
+                               places_restantes=places_restantes, max_accomp=max_accomp, complet=complet)
+        cached = (body, hashlib.sha1(body.encode('utf-8')).hexdigest())
+        _page_cache[cle] = cached
+    return cached
+
+@app.route('/places/stream')
+def places_stream():
+    global _flux_ouverts
+    event_id = evenement_demande(request.args)['id']
+    with _places_cond:
+        if _flux_ouverts >= SSE_FLUX_MAX:
+            # 204 : le navigateur ne se reconnecte pas, la page réessaie plus tard
+            return Response(status=204)
+        _flux_ouverts += 1
+
+    def fermer_flux():
+        global _flux_ouverts
+        with _places_cond:
+            _flux_ouverts -= 1
+
+    try:
+        demarrer_surveillant()
+        publier_places(event_id)
+    except Exception:
+        fermer_flux()
+        raise
+
+    def evenements():
+        fin = time.monotonic() + SSE_DUREE_MAX
+        derniere_version = None
+        yield 'retry: %d\n\n' % SSE_RECONNEXION_MS
+        while True:
+            reste = fin - time.monotonic()
+            if reste <= 0:
+                # Fin du flux : le navigateur se reconnecte après SSE_RECONNEXION_MS
+                return
+            with _places_cond:
+                _places_cond.wait_for(lambda: _places_etat[event_id][0] != derniere_version,
+                                      timeout=min(SSE_KEEPALIVE, reste))
+                version, restantes = _places_etat[event_id]
+            if version == derniere_version:
+                # Commentaire SSE pour garder la connexion ouverte
+                yield ': keepalive\n\n'
+                continue
+            derniere_version = version
+            yield 'data: %d\n\n' % restantes
+
+    response = Response(evenements(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Appelé à la fermeture de la réponse, même si le flux n'a jamais démarré
+    response.call_on_close(fermer_flux)
+    return response
 
 @app.route('/admin', methods=['GET', 'POST'])
 def admin():
@@ -225,19 +1545,131 @@ def admin():
             return redirect(url_for('liste'))
         else:
             flash('Mot de passe incorrect.')
-    return render_template_string(LOGIN_HTML)
+    return render_template(LOGIN_TEMPLATE)
+
+# Pagination par clé (id décroissant) : la page suivante reprend après le
+# dernier id affiché, sans OFFSET, donc le coût ne dépend pas de la page.
+TAILLE_PAGE = 50
+TAILLE_PAGE_MAX = 500
+TAILLE_ATTENTE = 20  # entrées de liste d'attente affichées dans /liste
 
 @app.route('/liste')
 def liste():
     if 'admin' not in session or not session['admin']:
         return redirect(url_for('admin'))
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT id, nom, prenom, email, laboratoire, accompagnants, commentaire FROM inscriptions ORDER BY id DESC')
+    evenement = evenement_demande(request.args, admin=True)
+    labo = request.args.get('labo', '').strip()
+    nom = request.args.get('nom', '').strip()
+    avant = request.args.get('avant', type=int)
+    taille = request.args.get('taille', TAILLE_PAGE, type=int)
+    taille = min(max(1, taille), TAILLE_PAGE_MAX)
+    conditions = ['event_id = ?']
+    params = [evenement['id']]
+    if avant:
+        conditions.append('id < ?')
+        params.append(avant)
+    if labo:
+        conditions.append('laboratoire = ?')
+        params.append(labo)
+    if nom:
+        # Préfixe exprimé en intervalle pour utiliser idx_inscriptions_event_nom
+        conditions.append('nom COLLATE NOCASE >= ? AND nom COLLATE NOCASE < ?')
+        params.extend([nom, nom + '\U0010ffff'])
+    where = 'WHERE ' + ' AND '.join(conditions)
+    c = get_db().cursor()
+    c.execute('SELECT id, nom, prenom, email, laboratoire, accompagnants, commentaire FROM inscriptions '
+              + where + ' ORDER BY id DESC LIMIT ?', params + [taille + 1])
     inscriptions = c.fetchall()
-    conn.close()
-    total_places_utilisees, places_restantes = get_places_stats()
-    return render_template_string(LISTE_HTML, inscriptions=inscriptions, max_places=MAX_PLACES, total_places=total_places_utilisees, places_restantes=places_restantes)
+    suivant = None
+    if len(inscriptions) > taille:
+        inscriptions = inscriptions[:taille]
+        suivant = inscriptions[-1][0]
+    total_places_utilisees, places_restantes = get_places_stats(evenement['id'])
+    c.execute('SELECT id, titre, ouvert FROM evenements ORDER BY id')
+    evenements = c.fetchall()
+    c.execute('SELECT nom, prenom, email, laboratoire, accompagnants, created_at FROM liste_attente WHERE event_id = ? ORDER BY id LIMIT ?',
+              (evenement['id'], TAILLE_ATTENTE))
+    attente = c.fetchall()
+    c.execute('SELECT COUNT(*) FROM liste_attente WHERE event_id = ?', (evenement['id'],))
+    attente_total = c.fetchone()[0]
+    return render_template(LISTE_TEMPLATE, attente=attente, attente_total=attente_total, inscriptions=inscriptions, max_places=evenement['capacite'], total_places=total_places_utilisees, places_restantes=places_restantes,
+                           evenement=evenement, evenements=evenements, quotas=quotas_labos(c, evenement['id']), labs=LABS, labo=labo, nom=nom, taille=taille, taille_max=TAILLE_PAGE_MAX, avant=avant, suivant=suivant)
+
+@app.route('/admin/inscriptions/<int:inscription_id>/supprimer', methods=['POST'])
+def admin_supprimer(inscription_id):
+    if 'admin' not in session or not session['admin']:
+        return redirect(url_for('admin'))
+    resultat = liberer_places(inscription_id)
+    if resultat is None:
+        abort(404)
+    return redirect(url_for('liste', evenement=resultat[0]))
+
+@app.route('/admin/inscriptions/<int:inscription_id>/accompagnants', methods=['POST'])
+def admin_accompagnants(inscription_id):
+    if 'admin' not in session or not session['admin']:
+        return redirect(url_for('admin'))
+    resultat = liberer_places(inscription_id, request.form.get('accompagnants', 0, type=int))
+    if resultat is None:
+        abort(404)
+    return redirect(url_for('liste', evenement=resultat[0]))
+
+def quotas_labos(c, event_id):
+    c.execute('SELECT laboratoire, places FROM places_labo WHERE event_id = ?', (event_id,))
+    places = dict(c.fetchall())
+    c.execute('SELECT laboratoire, quota, reserve FROM quotas_labo WHERE event_id = ?', (event_id,))
+    quotas = {labo: (quota, reserve) for labo, quota, reserve in c.fetchall()}
+    return [{'laboratoire': labo, 'places': places.get(labo, 0),
+             'quota': quotas.get(labo, (None, 0))[0], 'reserve': quotas.get(labo, (None, 0))[1]}
+            for labo in LABS]
+
+@app.route('/admin/quotas', methods=['POST'])
+def admin_quotas():
+    if 'admin' not in session or not session['admin']:
+        return redirect(url_for('admin'))
+    event_id = evenement_demande(request.args, admin=True)['id']
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    for labo in LABS:
+        quota = request.form.get('quota_' + labo, type=int)
+        reserve = max(0, request.form.get('reserve_' + labo, 0, type=int))
+        if quota is None and not reserve:
+            conn.execute('DELETE FROM quotas_labo WHERE event_id = ? AND laboratoire = ?', (event_id, labo))
+        else:
+            conn.execute('''
+                INSERT INTO quotas_labo (event_id, laboratoire, quota, reserve) VALUES (?, ?, ?, ?)
+                ON CONFLICT (event_id, laboratoire) DO UPDATE SET quota = excluded.quota, reserve = excluded.reserve
+            ''', (event_id, labo, None if quota is None else max(0, quota), reserve))
+    conn.execute('COMMIT')
+    return redirect(url_for('liste', evenement=event_id))
+
+@app.route('/admin/evenements', methods=['GET', 'POST'])
+def admin_evenements():
+    if 'admin' not in session or not session['admin']:
+        return redirect(url_for('admin'))
+    conn = get_db()
+    if request.method == 'POST':
+        event_id = request.form.get('id', type=int)
+        titre = request.form.get('titre', '').strip()
+        date = request.form.get('date', '').strip()
+        lieu = request.form.get('lieu', '').strip()
+        capacite = max(0, request.form.get('capacite', MAX_PLACES, type=int))
+        ouvert = 1 if request.form.get('ouvert') else 0
+        if titre:
+            if event_id:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('UPDATE evenements SET titre = ?, date = ?, lieu = ?, capacite = ?, ouvert = ? WHERE id = ?',
+                             (titre, date, lieu, capacite, ouvert, event_id))
+                # Une hausse de capacité libère des places pour la liste d'attente
+                _promouvoir_attente(conn.cursor(), event_id)
+                conn.execute('COMMIT')
+                publier_places(event_id)
+            else:
+                conn.execute('INSERT INTO evenements (titre, date, lieu, capacite, ouvert) VALUES (?, ?, ?, ?, ?)',
+                             (titre, date, lieu, capacite, ouvert))
+            _page_cache.clear()
+        return redirect(url_for('admin_evenements'))
+    evenements = conn.execute('SELECT id, titre, date, lieu, capacite, ouvert FROM evenements ORDER BY id').fetchall()
+    return render_template(EVENEMENTS_TEMPLATE, evenements=evenements, max_places=MAX_PLACES)
 
 @app.route('/logout')
 def logout():
@@ -246,25 +1678,74 @@ def logout():
 
 
 # Route pour exporter les inscriptions en CSV (admin seulement)
+# Export en flux : les lignes sont lues par lots avec fetchmany et envoyées au
+# fur et à mesure, la mémoire ne dépend donc pas de la taille de la table.
+# Compression gzip si le client l'accepte.
+EXPORT_BATCH = 500
+
+def generer_csv(event_id=None, compresser=False):
+    conn = _connect()
+    try:
+        c = conn.cursor()
+        if event_id:
+            c.execute('SELECT id, event_id, nom, prenom, email, laboratoire, accompagnants, commentaire FROM inscriptions WHERE event_id = ? ORDER BY id DESC',
+                      (event_id,))
+        else:
+            c.execute('SELECT id, event_id, nom, prenom, email, laboratoire, accompagnants, commentaire FROM inscriptions ORDER BY id DESC')
+        output = io.StringIO()
+        writer = csv.writer(output)
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compresser else None
+        writer.writerow(['id', 'event_id', 'nom', 'prenom', 'email', 'laboratoire', 'accompagnants', 'commentaire'])
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH)
+            writer.writerows(rows)
+            chunk = output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+            if gz is not None:
+                chunk = gz.compress(chunk)
+            if chunk:
+                yield chunk
+            if not rows:
+                break
+        if gz is not None:
+            yield gz.flush()
+    finally:
+        conn.close()
+
 @app.route('/export_csv')
 def export_csv():
     if 'admin' not in session or not session['admin']:
         return redirect(url_for('admin'))
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT id, nom, prenom, email, laboratoire, accompagnants, commentaire FROM inscriptions ORDER BY id DESC')
-    rows = c.fetchall()
-    conn.close()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['id', 'nom', 'prenom', 'email', 'laboratoire', 'accompagnants', 'commentaire'])
-    for row in rows:
-        writer.writerow(row)
-    csv_str = output.getvalue()
-    output.close()
-    response = Response(csv_str, mimetype='text/csv')
+    compresser = request.accept_encodings['gzip'] > 0
+    event_id = request.args.get('evenement', type=int)
+    response = Response(generer_csv(event_id, compresser), mimetype='text/csv')
     response.headers['Content-Disposition'] = 'attachment; filename=inscriptions.csv'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compresser:
+        response.headers['Content-Encoding'] = 'gzip'
     return response
 
+# API d'inscription en lot (admin seulement) : JSON (liste d'objets ou
+# {"inscriptions": [...]}) ou CSV avec ligne d'en-tête ; événement choisi
+# par ?evenement=<id> (par défaut le premier ouvert)
+@app.route('/admin/inscriptions/lot', methods=['POST'])
+def inscriptions_lot():
+    if 'admin' not in session or not session['admin']:
+        return jsonify({'erreur': 'authentification requise'}), 401
+    evenement = evenement_demande(request.args, admin=True)
+    if request.mimetype == 'text/csv':
+        texte = request.get_data(as_text=True)
+        lignes = list(csv.DictReader(io.StringIO(texte)))
+    else:
+        donnees = request.get_json(silent=True)
+        if isinstance(donnees, dict):
+            donnees = donnees.get('inscriptions')
+        if not isinstance(donnees, list):
+            return jsonify({'erreur': 'liste d\'inscriptions attendue (JSON ou CSV)'}), 400
+        lignes = donnees
+    resultats, inscrits, places_restantes = inscrire_lot(evenement['id'], lignes)
+    return jsonify({'inscrits': inscrits, 'places_restantes': places_restantes, 'resultats': resultats})
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,614 @@
+"""Banc d'essai de charge : simulation de l'ouverture des inscriptions.
+
+Chaque lancement travaille sur une base temporaire (jamais sur
+inscriptions.db) et pilote inscription.app soit via le client de test Flask,
+soit via un serveur WSGI local (--wsgi). Scénarios :
+
+  course   course aux places : N clients s'inscrivent en même temps sur un
+           événement de MAX_PLACES places ; rapporte le surbooking
+  mix      mélange GET / POST / sur un événement de grande capacité
+  admin    /liste et /export_csv pendant des inscriptions concurrentes
+  lot      import en masse de --lignes inscriptions (/admin/inscriptions/lot)
+  export   mémoire de pointe de l'export CSV (generer_csv) sur --lignes
+           inscriptions, comparée à un export dix fois plus petit
+  gabarits temps de rendu du formulaire : compilé à chaque fois, précompilé,
+           GET / sans et avec le cache de page
+  sheets   helpers de gsheet_storage contre une fausse feuille Google Sheets
+
+Pour chaque opération : nombre, erreurs, p50/p95/p99 (ms) et débit (req/s).
+
+Exemples :
+  python loadtest.py
+  python loadtest.py --scenario course --clients 300 --wsgi
+  SQLITE_JOURNAL_MODE=DELETE python loadtest.py --scenario mix
+  python loadtest.py --scenario mix --sans-pool
+"""
+import argparse
+import collections
+import contextlib
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import urllib.error
+import urllib.parse
+import urllib.request
+
+RACINE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, RACINE)
+
+# Base temporaire : inscription.py ouvre DB_FILE (chemin relatif) dès l'import
+_dossier = tempfile.TemporaryDirectory(prefix='loadtest-')
+os.chdir(_dossier.name)
+os.symlink(os.path.join(RACINE, 'static'), 'static')
+
+import inscription  # noqa: E402
+import gsheet_storage  # noqa: E402
+from flask import render_template_string  # noqa: E402
+
+app = inscription.app
+LABS = inscription.LABS
+
+
+# ------------------ Mesures ------------------
+class Mesures:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durees = {}   # opération -> [secondes]
+        self.erreurs = {}  # opération -> nombre
+
+    def noter(self, operation, duree, ok=True):
+        with self.lock:
+            self.durees.setdefault(operation, []).append(duree)
+            if not ok:
+                self.erreurs[operation] = self.erreurs.get(operation, 0) + 1
+
+
+def centile(valeurs, p):
+    if not valeurs:
+        return 0.0
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+
+def rapport(titre, mesures, duree_totale, extra=None):
+    print('\n== %s (%.2f s) ==' % (titre, duree_totale))
+    print('%-14s %7s %7s %9s %9s %9s %9s' % ('opération', 'n', 'erreurs', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+    for operation, durees in sorted(mesures.durees.items()):
+        print('%-14s %7d %7d %9.1f %9.1f %9.1f %9.1f' % (
+            operation, len(durees), mesures.erreurs.get(operation, 0),
+            centile(durees, 50) * 1000, centile(durees, 95) * 1000, centile(durees, 99) * 1000,
+            len(durees) / duree_totale if duree_totale else 0))
+    for cle, valeur in (extra or {}).items():
+        print('%s : %s' % (cle, valeur))
+
+
+def lancer(nb_clients, travail):
+    """Démarre nb_clients threads ensemble (barrière) et renvoie la durée totale."""
+    barriere = threading.Barrier(nb_clients + 1)
+
+    def client(i):
+        barriere.wait()
+        travail(i)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(nb_clients)]
+    for t in threads:
+        t.start()
+    barriere.wait()
+    debut = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - debut
+
+
+# ------------------ Clients HTTP ------------------
+class ClientTest:
+    """Client de test Flask (en processus)."""
+    def __init__(self):
+        self.client = app.test_client()
+
+    def requete(self, methode, chemin, donnees=None, json_=None):
+        r = self.client.open(chemin, method=methode, data=donnees, json=json_)
+        corps = r.get_data()
+        return r.status_code, corps
+
+
+class ClientWSGI:
+    """Client urllib vers le serveur WSGI local (avec cookies de session)."""
+    base = None
+
+    def __init__(self):
+        self.ouvreur = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def requete(self, methode, chemin, donnees=None, json_=None):
+        entetes = {}
+        corps = None
+        if json_ is not None:
+            corps = json.dumps(json_).encode()
+            entetes['Content-Type'] = 'application/json'
+        elif donnees is not None:
+            corps = urllib.parse.urlencode(donnees).encode()
+        req = urllib.request.Request(self.base + chemin, data=corps, method=methode, headers=entetes)
+        try:
+            with self.ouvreur.open(req) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def demarrer_serveur_wsgi():
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # pas une ligne par requête
+    serveur = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    ClientWSGI.base = 'http://127.0.0.1:%d' % serveur.server_port
+    return serveur
+
+
+Client = ClientTest
+
+
+def client_admin():
+    c = Client()
+    c.requete('POST', '/admin', {'password': inscription.ADMIN_PASSWORD})
+    return c
+
+
+def chronometrer(mesures, operation, c, methode, chemin, donnees=None, json_=None, attendus=(200, 302)):
+    debut = time.perf_counter()
+    try:
+        statut, corps = c.requete(methode, chemin, donnees, json_)
+        ok = statut in attendus
+    except Exception:
+        statut, corps, ok = None, b'', False
+    mesures.noter(operation, time.perf_counter() - debut, ok)
+    return statut, corps
+
+
+# ------------------ Base de test ------------------
+def base():
+    conn = sqlite3.connect(inscription.DB_FILE, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 30000')
+    return conn
+
+
+def creer_evenement(titre, capacite):
+    conn = base()
+    c = conn.execute('INSERT INTO evenements (titre, date, lieu, capacite, ouvert) VALUES (?, ?, ?, ?, 1)',
+                     (titre, '', '', capacite))
+    event_id = c.lastrowid
+    conn.close()
+    inscription._page_cache.clear()
+    return event_id
+
+
+def places_occupees(event_id):
+    """Places réellement prises (recomptées) et compteur maintenu par les triggers."""
+    conn = base()
+    reel = conn.execute('SELECT COUNT(*) + COALESCE(SUM(accompagnants), 0) FROM inscriptions WHERE event_id = ?',
+                        (event_id,)).fetchone()[0]
+    compteur = conn.execute('SELECT inscrits + accompagnants FROM places_evenement WHERE event_id = ?',
+                            (event_id,)).fetchone()
+    conn.close()
+    return reel, compteur[0] if compteur else None
+
+
+def formulaire(i, event_id=None):
+    return {'nom': 'Nom%d' % i, 'prenom': 'Prenom%d' % i, 'email': 'n%d@exemple.com' % i,
+            'laboratoire': LABS[i % len(LABS)], 'accompagnants': str(random.randint(0, 3)),
+            'jeton': '%d-%d' % (event_id or 0, i)}
+
+
+# ------------------ Scénarios ------------------
+def scenario_course(args):
+    capacite = inscription.MAX_PLACES
+    event_id = creer_evenement('course', capacite)
+    mesures = Mesures()
+
+    def travail(i):
+        chronometrer(mesures, 'POST /', Client(), 'POST', '/?evenement=%d' % event_id, formulaire(i, event_id))
+
+    duree = lancer(args.clients, travail)
+    reel, compteur = places_occupees(event_id)
+    attente = base().execute('SELECT COUNT(*) FROM liste_attente WHERE event_id = ?', (event_id,)).fetchone()[0]
+    rapport('course aux places (%d clients, %d places)' % (args.clients, capacite), mesures, duree, {
+        'places prises': '%d / %d' % (reel, capacite),
+        'compteur places_evenement': compteur,
+        "liste d'attente": attente,
+        'surbooking': max(0, reel - capacite),
+    })
+    return max(0, reel - capacite)
+
+
+def scenario_mix(args):
+    event_id = creer_evenement('mix', 10 ** 9)
+    mesures = Mesures()
+    compteur = iter(range(10 ** 9))
+    verrou = threading.Lock()
+
+    def travail(i):
+        c = Client()
+        for _ in range(args.requetes):
+            if random.random() < args.part_post:
+                with verrou:
+                    n = next(compteur)
+                chronometrer(mesures, 'POST /', c, 'POST', '/?evenement=%d' % event_id, formulaire(n, event_id))
+            else:
+                chronometrer(mesures, 'GET /', c, 'GET', '/?evenement=%d' % event_id)
+
+    duree = lancer(args.clients, travail)
+    rapport('mix GET/POST (%d clients x %d requêtes, %d%% POST)' % (args.clients, args.requetes, args.part_post * 100),
+            mesures, duree)
+
+
+def scenario_admin(args):
+    event_id = creer_evenement('admin', 10 ** 9)
+    # Un peu de volume pour que liste et export aient du travail
+    client_admin().requete('POST', '/admin/inscriptions/lot?evenement=%d' % event_id,
+                           json_=[formulaire(i) for i in range(args.lignes)])
+    mesures = Mesures()
+    nb_admins = max(1, args.clients // 10)
+    compteur = iter(range(args.lignes, 10 ** 9))
+    verrou = threading.Lock()
+
+    def travail(i):
+        if i < nb_admins:
+            c = client_admin()
+            for k in range(max(1, args.requetes // 5)):
+                if k % 2:
+                    chronometrer(mesures, 'GET /export', c, 'GET', '/export_csv?evenement=%d' % event_id)
+                else:
+                    chronometrer(mesures, 'GET /liste', c, 'GET', '/liste?evenement=%d' % event_id)
+        else:
+            c = Client()
+            for _ in range(args.requetes):
+                with verrou:
+                    n = next(compteur)
+                chronometrer(mesures, 'POST /', c, 'POST', '/?evenement=%d' % event_id, formulaire(n, event_id))
+
+    duree = lancer(args.clients, travail)
+    rapport('admin sous charge (%d admins, %d inscrits)' % (nb_admins, args.clients - nb_admins), mesures, duree)
+
+
+def scenario_lot(args):
+    event_id = creer_evenement('lot', 10 ** 9)
+    mesures = Mesures()
+    lignes = [formulaire(i) for i in range(args.lignes)]
+    c = client_admin()
+    debut = time.perf_counter()
+    statut, corps = chronometrer(mesures, 'POST /lot', c, 'POST', '/admin/inscriptions/lot?evenement=%d' % event_id,
+                                 json_=lignes)
+    duree = time.perf_counter() - debut
+    inscrits = json.loads(corps).get('inscrits') if statut == 200 else None
+    rapport('import en masse (%d lignes)' % args.lignes, mesures, duree, {
+        'inscrits': inscrits,
+        'lignes/s': '%.0f' % (args.lignes / duree if duree else 0),
+    })
+
+
+def remplir(event_id, n):
+    conn = base()
+    conn.executemany(
+        'INSERT INTO inscriptions (event_id, nom, prenom, email, laboratoire, accompagnants, commentaire, '
+        'nom_norm, prenom_norm) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((event_id, 'Nom%d' % i, 'Prenom%d' % i, 'n%d@exemple.com' % i, LABS[i % len(LABS)], i % 3,
+          'commentaire %d' % i, 'nom%d' % i, 'prenom%d' % i) for i in range(n)))
+    conn.close()
+
+
+def scenario_export(args):
+    # L'export est un générateur : sa mémoire de pointe ne doit pas dépendre
+    # du nombre de lignes. On compare --lignes à --lignes / 10.
+    mesures = Mesures()
+    pointes = {}
+    debut = time.perf_counter()
+    for n in (max(args.lignes // 10, 1), args.lignes):
+        event_id = creer_evenement('export %d' % n, 10 ** 9)
+        remplir(event_id, n)
+        for compresser in (False, True):
+            tracemalloc.start()
+            t = time.perf_counter()
+            taille = sum(len(morceau) for morceau in inscription.generer_csv(event_id, compresser))
+            mesures.noter('gzip' if compresser else 'csv', time.perf_counter() - t)
+            pointes[n, compresser] = (tracemalloc.get_traced_memory()[1], taille)
+            tracemalloc.stop()
+    duree = time.perf_counter() - debut
+    petit, grand = sorted({n for n, _ in pointes})
+    # Marge fixe pour les allocations de l'interpréteur (caches, etc.)
+    croissance = [c for c in (False, True)
+                  if pointes[grand, c][0] > 2 * pointes[petit, c][0] + 256 * 1024]
+    rapport('export CSV (%d puis %d lignes)' % (petit, grand), mesures, duree, dict({
+        'mémoire de pointe %s %d lignes' % ('gzip' if c else 'csv', n): '%d Kio (sortie %d Kio)' % (
+            pointe // 1024, taille // 1024)
+        for (n, c), (pointe, taille) in sorted(pointes.items())
+    }, **{'mémoire proportionnelle aux lignes': 'oui' if croissance else 'non'}))
+    return len(croissance)
+
+
+def scenario_gabarits(args):
+    # Avant/après la précompilation des gabarits et le cache de page :
+    # compilation à chaque rendu (render_template_string), gabarit
+    # précompilé, puis GET / complet sans et avec le cache de page
+    evenement = inscription.get_evenement(inscription.evenement_par_defaut())
+    contexte = dict(evenement=evenement, ouverts=inscription.evenements_ouverts(), places_restantes=10,
+                    max_accomp=9, complet=False)
+    mesures = Mesures()
+    debut = time.perf_counter()
+    with app.test_request_context('/'):
+        for _ in range(args.requetes * 10):
+            t = time.perf_counter()
+            render_template_string(inscription.FORM_HTML, **contexte)
+            mesures.noter('FORM_HTML brut', time.perf_counter() - t)
+            t = time.perf_counter()
+            inscription.render_template(inscription.FORM_TEMPLATE, **contexte)
+            mesures.noter('FORM_TEMPLATE', time.perf_counter() - t)
+    c = Client()
+    for _ in range(args.requetes * 10):
+        inscription._page_cache.clear()
+        chronometrer(mesures, 'GET / froid', c, 'GET', '/')
+        chronometrer(mesures, 'GET / cache', c, 'GET', '/')
+    duree = time.perf_counter() - debut
+    rapport('rendu des gabarits', mesures, duree)
+
+
+class ErreurQuota(Exception):
+    """Imite le gspread.exceptions.APIError renvoyé par Google au-delà du quota."""
+    def __init__(self):
+        super().__init__('429 RESOURCE_EXHAUSTED (simulé)')
+        self.response = types.SimpleNamespace(status_code=429)
+
+
+class FausseFeuille:
+    """Feuille Google Sheets en mémoire, avec latence simulée par appel.
+
+    Avec echecs > 0, append_rows() échoue dans cette proportion des appels :
+    une fois sur deux avant d'écrire, une fois sur deux après (réponse perdue).
+    Avec quota > 0, les lectures ou écritures au-delà de quota par minute glissante sont
+    refusés par une ErreurQuota, comme le fait l'API.
+    """
+    def __init__(self, latence=0.0, echecs=0.0, quota=0):
+        self.lignes = []
+        self.latence = latence
+        self.echecs = echecs
+        self.quota = quota
+        self.recents = {'lecture': collections.deque(), 'ecriture': collections.deque()}
+        self.refus = 0
+        self.appels = {}
+        self.lock = threading.Lock()
+
+    def _appel(self, nom):
+        with self.lock:
+            self.appels[nom] = self.appels.get(nom, 0) + 1
+            if self.quota:
+                # Deux quotas distincts, comme l'API : lectures et écritures
+                recents = self.recents['ecriture' if nom in ('append_row', 'append_rows', 'update') else 'lecture']
+                maintenant = time.monotonic()
+                while recents and recents[0] <= maintenant - 60:
+                    recents.popleft()
+                if len(recents) >= self.quota:
+                    self.refus += 1
+                    raise ErreurQuota()
+                recents.append(maintenant)
+        if self.latence:
+            time.sleep(self.latence)
+
+    def get_all_values(self):
+        self._appel('get_all_values')
+        with self.lock:
+            return [list(r) for r in self.lignes]
+
+    def get_all_records(self):
+        self._appel('get_all_records')
+        with self.lock:
+            if not self.lignes:
+                return []
+            entetes = self.lignes[0]
+            return [dict(zip(entetes, r + [''] * (len(entetes) - len(r)))) for r in self.lignes[1:]]
+
+    def append_row(self, row):
+        self._appel('append_row')
+        with self.lock:
+            self.lignes.append([str(x) for x in row])
+
+    def append_rows(self, rows):
+        self._appel('append_rows')
+        tirage = random.random()
+        if tirage < self.echecs / 2:
+            raise ConnectionError('échec simulé avant écriture')
+        with self.lock:
+            self.lignes.extend([str(x) for x in r] for r in rows)
+        if tirage < self.echecs:
+            raise ConnectionError('échec simulé après écriture')
+
+    def update(self, plage, valeurs):
+        self._appel('update')
+        with self.lock:
+            if plage == 'A1':
+                if self.lignes:
+                    self.lignes[0] = list(valeurs[0])
+                else:
+                    self.lignes.append(list(valeurs[0]))
+
+    def _plage(self, plage):
+        # « A5:H » ou « A1:H1 » : lignes numérotées à partir de 1, colonnes ignorées
+        debut, fin = plage.split(':')
+        fin = fin.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+        return [list(r) for r in self.lignes[int(debut[1:]) - 1:int(fin) if fin else None]]
+
+    def get(self, plage):
+        self._appel('get')
+        with self.lock:
+            return self._plage(plage)
+
+    def batch_get(self, plages):
+        self._appel('batch_get')
+        with self.lock:
+            return [self._plage(p) for p in plages]
+
+    @property
+    def row_count(self):
+        with self.lock:
+            return len(self.lignes)
+
+
+def scenario_sheets(args):
+    feuille = FausseFeuille(args.latence_sheets / 1000, args.echecs_sheets)
+    gsheet_storage.ensure_headers(feuille)
+    # Quota appliqué par la fausse feuille et respecté côté client
+    feuille.quota = args.quota_sheets
+    if args.quota_sheets:
+        gsheet_storage.SHEETS_BUCKETS.update(gsheet_storage.quota_buckets(args.quota_sheets, args.quota_sheets))
+    # Comme streamlit_app.py : copie locale partagée, verrou d'écriture et
+    # journal local (--sheets-direct : écriture immédiate dans la feuille),
+    # sauf --sheets-sans-cache
+    journal = None if args.sheets_direct else os.path.join(_dossier.name, 'gsheet_journal.db')
+    ws = feuille if args.sheets_sans_cache else gsheet_storage.CachedWorksheet(
+        feuille, ttl=args.ttl_sheets, default_event_id=1, journal_path=journal)
+    verrou = contextlib.nullcontext() if args.sheets_sans_cache else ws.write_lock
+    # Seconde copie sur le même journal, comme après une reconstruction par
+    # st.cache_resource : son vidage tourne en même temps que celui de ws
+    ws2 = gsheet_storage.CachedWorksheet(feuille, ttl=args.ttl_sheets, default_event_id=1, journal_path=journal) \
+        if journal and not args.sheets_sans_cache else None
+    event = {'id': 1, 'capacite': inscription.MAX_PLACES, 'quotas': {}, 'reserves': {}}
+    mesures = Mesures()
+    appels_avant = sum(feuille.appels.values())
+    inscrits = []
+
+    # Même enchaînement que le formulaire de streamlit_app.py
+    def travail(i):
+        t = time.perf_counter()
+        gsheet_storage.get_places_stats(ws, event)
+        mesures.noter('stats', time.perf_counter() - t)
+        f = formulaire(i)
+        t = time.perf_counter()
+        if gsheet_storage.nom_prenom_deja_inscrit(ws, f['nom'], f['prenom'], 1):
+            return
+        with verrou:
+            restantes, disponibles = gsheet_storage.places_disponibles_labo(ws, event, f['laboratoire'])
+            if restantes > 0 and disponibles > 0:
+                accompagnants = min(int(f['accompagnants']), max(disponibles - 1, 0))
+                gsheet_storage.append_inscription(ws, dict(f, accompagnants=accompagnants, event_id=1,
+                                                           created_at=time.strftime('%Y-%m-%dT%H:%M:%S')))
+                inscrits.append(i)
+        mesures.noter('inscription', time.perf_counter() - t)
+
+    duree = lancer(args.clients, travail)
+    extra = {}
+    if getattr(ws, 'journal', None) is not None:
+        # Une inscription encore dans le journal doit bloquer la même personne
+        # après une relecture complète de la feuille (autre séance, hors capacité)
+        with ws._flush_lock:
+            gsheet_storage.append_inscription(ws, dict(formulaire(10 ** 6), nom='Dupont', prenom='Éloïse',
+                                                       accompagnants=0, event_id=2))
+            inscrits.append(10 ** 6)
+            ws.resync_interval, intervalle = 0, ws.resync_interval
+            ws.invalidate()
+            ws.dataframe()
+            ws.resync_interval = intervalle
+            doublon_accepte = not gsheet_storage.nom_prenom_deja_inscrit(ws, 'dupont', 'eloise', 2)
+        # Vide le journal (en réessayant après les échecs simulés) puis vérifie
+        # que chaque inscription est arrivée exactement une fois
+        debut = time.perf_counter()
+        for _ in range(1000):
+            try:
+                if not ws.flush() + ws2.flush() and not ws.pending_count():
+                    break
+            except (ConnectionError, ErreurQuota):
+                pass
+            ws.invalidate()
+            ws.dataframe()
+        refs = [ligne[gsheet_storage.HEADERS.index('ref')] for ligne in feuille.lignes[1:]]
+        extra = {
+            'vidage du journal': '%.2f s' % (time.perf_counter() - debut),
+            'lignes dans la feuille': '%d pour %d inscriptions' % (len(refs), len(inscrits)),
+            'lignes en double': len(refs) - len(set(refs)),
+            'doublon accepté après relecture': 'oui' if doublon_accepte else 'non',
+        }
+    total, _ = gsheet_storage.get_places_stats(feuille, event)
+    appels = sum(feuille.appels.values()) - appels_avant - 1
+    rapport('Streamlit / fausse feuille (%d clients, latence %g ms, %s)' % (
+                args.clients, args.latence_sheets,
+                'sans cache' if args.sheets_sans_cache else 'copie locale %g s, %s' % (
+                    args.ttl_sheets, 'écriture directe' if args.sheets_direct else 'journal')),
+            mesures, duree, dict({
+                'places prises': '%d / %d' % (total, event['capacite']),
+                'surbooking': max(0, total - event['capacite']),
+                'appels API': dict(sorted(feuille.appels.items())),
+                'appels API par inscription': '%.2f' % (appels / args.clients),
+                'refus de quota (429)': feuille.refus,
+                'nouvelles tentatives': sum(s['retries'] for s in ws.api_stats_snapshot().values())
+                    if hasattr(ws, 'api_stats_snapshot') else 0,
+            }, **extra))
+    echecs = max(0, total - event['capacite'])
+    if extra:
+        echecs += extra['lignes en double'] + (extra['doublon accepté après relecture'] == 'oui')
+    return echecs
+
+
+SCENARIOS = {
+    'course': scenario_course,
+    'mix': scenario_mix,
+    'admin': scenario_admin,
+    'lot': scenario_lot,
+    'export': scenario_export,
+    'gabarits': scenario_gabarits,
+    'sheets': scenario_sheets,
+}
+
+
+def main():
+    global Client
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', choices=['tous'] + list(SCENARIOS), default='tous')
+    parser.add_argument('--clients', type=int, default=100, help='clients simultanés')
+    parser.add_argument('--requetes', type=int, default=20, help='requêtes par client (mix, admin)')
+    parser.add_argument('--part-post', type=float, default=0.1, help='part de POST dans le mix')
+    parser.add_argument('--lignes', type=int, default=10000, help="lignes de l'import en masse")
+    parser.add_argument('--latence-sheets', type=float, default=50, help='latence simulée par appel Sheets (ms)')
+    parser.add_argument('--ttl-sheets', type=float, default=5, help="durée de vie de l'instantané Sheets (s)")
+    parser.add_argument('--sheets-sans-cache', action='store_true',
+                        help='appeler la fausse feuille directement, sans copie locale ni verrou')
+    parser.add_argument('--sheets-direct', action='store_true',
+                        help='écrire chaque inscription dans la feuille, sans journal local')
+    parser.add_argument('--echecs-sheets', type=float, default=0.0,
+                        help='proportion des append_rows qui échouent (avant ou après écriture)')
+    parser.add_argument('--quota-sheets', type=int, default=0,
+                        help='appels Sheets autorisés par minute (0 : pas de quota)')
+    parser.add_argument('--wsgi', action='store_true', help='passer par un serveur WSGI local')
+    parser.add_argument('--sans-pool', action='store_true', help='une connexion SQLite par requête')
+    parser.add_argument('--admission', action='store_true',
+                        help="garder le contrôle d'admission de POST / (désactivé par défaut)")
+    parser.add_argument('--graine', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.graine)
+    app.config['TESTING'] = True
+    if not args.admission:
+        app.config['ADMISSION_RAFALE_IP'] = 10 ** 9
+        app.config['ADMISSION_CONCURRENCE_MAX'] = 10 ** 9
+    if args.sans_pool:
+        inscription.POOL_MAX = 0
+    if args.wsgi:
+        demarrer_serveur_wsgi()
+        Client = ClientWSGI
+    print('base : %s (journal %s, pool %s, client %s)' % (
+        os.path.join(_dossier.name, inscription.DB_FILE), app.config['SQLITE_JOURNAL_MODE'],
+        'non' if args.sans_pool else inscription.POOL_MAX, 'WSGI' if args.wsgi else 'test Flask'))
+
+    surbooking = 0
+    for nom, scenario in SCENARIOS.items():
+        if args.scenario in ('tous', nom):
+            surbooking += scenario(args) or 0
+    return 1 if surbooking else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,18 @@
+from collections import OrderedDict
 from datetime import datetime, date
 from pathlib import Path
+import logging
+import threading
+import time
+import uuid
 import pandas as pd
 import streamlit as st
 import gspread
+from gsheet_storage import (HEADERS, CachedWorksheet, ensure_headers, gsheet_to_df, nom_prenom_deja_inscrit,
+                            append_inscription, get_places_stats, places_disponibles_labo, sheets_call)
 
 # ------------------ Config ------------------
-MAX_PLACES = 50
+MAX_PLACES = 50  # capacité par défaut d'un événement
 LABS = ["Ma1","Ma2","Bo","ÇA","IS","DE","BS","YS","CL","DA","ME","SH","AM","EU","SS","FL","QG"]
 STATIC_DIR = Path("static")
 IMG_FORM = STATIC_DIR / "badmington.jpg"
@@ -22,11 +29,50 @@ ADMIN_PASSWORD = st.secrets.get("admin_password", "jD9!wX4@Lm82Qz")
 # [gsheet]
 # spreadsheet_name = "Inscriptions Badminton"
 # worksheet_title = "Feuille 1"
+# cache_ttl = 5
+# journal = "gsheet_journal.db"   # local write-behind journal ("" to write to the sheet directly)
+# waitlist_worksheet = "Liste d'attente"   # created on first use
+# log_level = "INFO"   # Sheets API call log; "WARNING" keeps only failures and retries
 SHEET_NAME = st.secrets.get("gsheet", {}).get("spreadsheet_name", "Inscriptions Badminton")
 WORKSHEET_TITLE = st.secrets.get("gsheet", {}).get("worksheet_title", None)  # default: first sheet
-
-# Expected headers in the sheet
-HEADERS = ["nom", "prenom", "email", "laboratoire", "accompagnants", "commentaire", "created_at"]
+# Seconds a sheet snapshot is reused by every session (cache_ttl = 0 to always re-read)
+SHEET_CACHE_TTL = float(st.secrets.get("gsheet", {}).get("cache_ttl", 5))
+# Registrations are committed to this SQLite journal, then pushed to the sheet in batches
+SHEET_JOURNAL = st.secrets.get("gsheet", {}).get("journal", "gsheet_journal.db")
+# Sign-ups received once an event is full, in arrival order (same columns as the main sheet)
+WAITLIST_TITLE = st.secrets.get("gsheet", {}).get("waitlist_worksheet", "Liste d'attente")
+
+# Sheets API calls (count, latency, retries) are logged by gsheet_storage at INFO;
+# the script is re-run on every interaction, so the handler is added only once
+SHEET_LOG = logging.getLogger("gsheet_storage")
+if not SHEET_LOG.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    SHEET_LOG.addHandler(_handler)
+    SHEET_LOG.propagate = False
+SHEET_LOG.setLevel(st.secrets.get("gsheet", {}).get("log_level", "INFO"))
+
+# Events (several sessions per season), can be overridden via Secrets:
+# [[events]]
+# id = 2
+# titre = "Matinée Badminton 12/10/2025"
+# date = "Dimanche 12/10/2025 matin"
+# lieu = "..."
+# capacite = 40
+# quotas = { IS = 10, DE = 8 }    # optional: max seats (with companions) per lab
+# reserves = { BS = 5 }          # optional: seats kept for a lab until it fills them
+DEFAULT_EVENT = {
+    "id": 1,
+    "titre": "Matinée Badminton 28/09/2025",
+    "date": "Dimanche 28/09/2025 matin",
+    "lieu": "Gymnase du lycée Val de Seine, 5–11 Avenue Georges Braque, 76120 Le Grand‑Quevilly",
+    "capacite": MAX_PLACES,
+    "quotas": {},
+    "reserves": {},
+}
+EVENTS = [{**DEFAULT_EVENT, **dict(ev)} for ev in st.secrets.get("events", [])] or [DEFAULT_EVENT]
+EVENTS_BY_ID = {int(ev["id"]): ev for ev in EVENTS}
+DEFAULT_EVENT_ID = int(EVENTS[0]["id"])  # event of the rows written before event_id existed
 
 # ------------------ Google Sheets helpers ------------------
 @st.cache_resource(show_spinner=False)
@@ -36,62 +82,73 @@ def get_gsheet_client():
     gc = gspread.service_account_from_dict(sa_dict)
     return gc
 
+# Every API call, including opening the spreadsheet, draws from the quota
+# shared by all worksheets of the process (gsheet_storage.SHEETS_BUCKETS)
 @st.cache_resource(show_spinner=False)
-def get_worksheet():
-    gc = get_gsheet_client()
+def get_spreadsheet():
     # Open spreadsheet by name
-    sh = gc.open(SHEET_NAME)
+    return sheets_call(get_gsheet_client(), "open", SHEET_NAME)
+
+@st.cache_resource(show_spinner=False)
+def get_worksheet():
+    sh = get_spreadsheet()
     # Pick worksheet
     if WORKSHEET_TITLE:
-        ws = sh.worksheet(WORKSHEET_TITLE)
+        ws = sheets_call(sh, "worksheet", WORKSHEET_TITLE)
     else:
-        ws = sh.sheet1
+        ws = sheets_call(sh, "get_worksheet", 0)  # sheet1
+    # Local copy shared by all sessions, refreshed by reading only the new rows
+    cached = CachedWorksheet(ws, ttl=SHEET_CACHE_TTL, default_event_id=DEFAULT_EVENT_ID,
+                             journal_path=SHEET_JOURNAL or None)
     # Ensure headers exist
-    values = ws.get_all_values()
-    if not values:
-        ws.append_row(HEADERS)
-    else:
-        # If headers present but not matching, ensure at least columns exist
-        if [h.strip().lower() for h in values[0]] != HEADERS:
-            # Try to set the first row to our headers (non-destructive if already in place)
-            ws.update('A1', [HEADERS])
-    return ws
-
-# Read entire sheet into DataFrame (excluding header row)
-def gsheet_to_df(ws) -> pd.DataFrame:
-    rows = ws.get_all_records()  # returns list of dicts, using first row as header
-    if not rows:
-        return pd.DataFrame(columns=HEADERS)
-    df = pd.DataFrame(rows)
-    # Normalize dtypes
-    if "accompagnants" in df.columns:
-        df["accompagnants"] = pd.to_numeric(df["accompagnants"], errors="coerce").fillna(0).astype(int)
-    return df
-
-def nom_prenom_deja_inscrit(ws, nom: str, prenom: str) -> bool:
-    df = gsheet_to_df(ws)
-    if df.empty or not {"nom", "prenom"}.issubset(df.columns):
-        return False
-    n = (nom or "").strip().lower()
-    p = (prenom or "").strip().lower()
-    return ((df["nom"].astype(str).str.strip().str.lower() == n) &
-            (df["prenom"].astype(str).str.strip().str.lower() == p)).any()
-
-# Append one inscription (values must follow HEADERS order)
-def append_inscription(ws, data: dict):
-    row = [data.get("nom",""), data.get("prenom",""), data.get("email",""),
-           data.get("laboratoire",""), int(data.get("accompagnants",0)),
-           data.get("commentaire",""), data.get("created_at","")]
-    ws.append_row(row)
-
-# ------------------ Business logic ------------------
-def get_places_stats(ws):
-    df = gsheet_to_df(ws)
-    count_inscrits = len(df)  # one row per salarié inscrit
-    sum_accomp = int(df["accompagnants"].sum()) if not df.empty else 0
-    total = count_inscrits + sum_accomp
-    restantes = MAX_PLACES - total
-    return max(total, 0), max(restantes, 0)
+    ensure_headers(cached)
+    return cached
+
+@st.cache_resource(show_spinner=False)
+def get_waitlist_worksheet():
+    sh = get_spreadsheet()
+    try:
+        ws = sheets_call(sh, "worksheet", WAITLIST_TITLE)
+    except gspread.exceptions.WorksheetNotFound:
+        ws = sheets_call(sh, "add_worksheet", title=WAITLIST_TITLE, rows=1000, cols=len(HEADERS))
+    # No journal: a waitlist entry is rare and written straight to the sheet
+    cached = CachedWorksheet(ws, ttl=SHEET_CACHE_TTL, default_event_id=DEFAULT_EVENT_ID)
+    ensure_headers(cached)
+    return cached
+
+# ------------------ Idempotence des soumissions ------------------
+SOUMISSION_DUREE = 24 * 3600  # durée de conservation des jetons, en secondes
+
+@st.cache_resource(show_spinner=False)
+def get_soumissions():
+    # Registre partagé par toutes les sessions du process, du plus ancien au
+    # plus récent : (jeton de session, empreinte du formulaire) -> (horodatage, niveau, message)
+    return {"lock": threading.Lock(), "jetons": OrderedDict()}
+
+def reserver_jeton(cle):
+    """Réserve le jeton ; renvoie le résultat déjà enregistré s'il a déjà été utilisé."""
+    reg = get_soumissions()
+    maintenant = time.time()
+    jetons = reg["jetons"]
+    with reg["lock"]:
+        # Purge par le début : seuls les jetons expirés sont parcourus
+        while jetons and next(iter(jetons.values()))[0] < maintenant - SOUMISSION_DUREE:
+            jetons.popitem(last=False)
+        if cle in jetons:
+            return jetons[cle]
+        jetons[cle] = (maintenant, "info", "Inscription en cours d'enregistrement…")
+    return None
+
+def enregistrer_jeton(cle, niveau, message):
+    reg = get_soumissions()
+    with reg["lock"]:
+        reg["jetons"][cle] = (time.time(), niveau, message)
+        reg["jetons"].move_to_end(cle)
+
+def liberer_jeton(cle):
+    reg = get_soumissions()
+    with reg["lock"]:
+        reg["jetons"].pop(cle, None)
 
 # ------------------ UI ------------------
 st.set_page_config(page_title="Inscription Badminton", page_icon="🏸", layout="centered")
@@ -103,8 +160,14 @@ with colL:
     st.markdown(
         "> **Activité privée, hors temps de travail**  \n> Réservée au personnel des laboratoires de Rouen (accompagnants possibles, **priorité aux salariés**)."
     )
-    st.write("**Lieu :** Gymnase du lycée Val de Seine, 5–11 Avenue Georges Braque, 76120 Le Grand‑Quevilly")
-    st.write("**Date :** Dimanche 28/09/2025 matin")
+    if len(EVENTS) > 1:
+        event_id = st.selectbox("Séance", list(EVENTS_BY_ID), format_func=lambda i: EVENTS_BY_ID[i]["titre"])
+    else:
+        event_id = int(EVENTS[0]["id"])
+    EVENT = EVENTS_BY_ID[event_id]
+    CAPACITE = int(EVENT["capacite"])
+    st.write(f"**Lieu :** {EVENT['lieu']}")
+    st.write(f"**Date :** {EVENT['date']}")
 with colR:
     if IMG_FORM.exists():
         st.image(str(IMG_FORM), use_container_width=True, caption="Affiche")
@@ -135,10 +198,16 @@ with tab_inscription:
             else:
                 st.error("Mot de passe incorrect.")
         st.stop()
-    total, restantes = get_places_stats(WS)
-    st.markdown(f"**Places restantes : {restantes}**  _(capacité totale {MAX_PLACES})_")
-    pct = int(100 * (MAX_PLACES - restantes) / MAX_PLACES)
-    st.progress(pct, text=f"{MAX_PLACES - restantes}/{MAX_PLACES} places prises – {restantes} restantes")
+    try:
+        total, restantes = get_places_stats(WS, EVENT, DEFAULT_EVENT_ID)
+    except Exception:
+        # Quota dépassé ou panne de Google malgré les nouvelles tentatives
+        logging.exception("Lecture des places impossible")
+        st.error("Le service d'inscription est très sollicité. Réessayez dans une minute.")
+        st.stop()
+    st.markdown(f"**Places restantes : {restantes}**  _(capacité totale {CAPACITE})_")
+    pct = int(100 * (CAPACITE - restantes) / CAPACITE) if CAPACITE else 100
+    st.progress(pct, text=f"{CAPACITE - restantes}/{CAPACITE} places prises – {restantes} restantes")
 
     # Ouverture des accompagnants à partir du 01/09/2025
     OPEN_DATE = date(2025, 9, 1)
@@ -150,9 +219,53 @@ with tab_inscription:
         st.success("Accompagnants désormais ouverts ✅ Vous pouvez ajouter vos accompagnants ou les renseigner lors de l’inscription.")
 
     if restantes <= 0:
-        st.error("Complet – il n'y a plus de places disponibles.")
+        # Complet : on garde la demande sur la liste d'attente, l'organisateur
+        # recontacte les personnes dans l'ordre d'arrivée si des places se libèrent
+        st.error("Complet – il n'y a plus de places disponibles. Vous pouvez rejoindre la liste d'attente.")
+        with st.form("form_attente", border=True):
+            col1, col2 = st.columns(2)
+            with col1:
+                nom = st.text_input("Nom *", value="", placeholder="Dupont")
+                email = st.text_input("Email *", value="", placeholder="prenom.nom@exemple.com")
+            with col2:
+                prenom = st.text_input("Prénom*", value="")
+                laboratoire = st.selectbox("Laboratoire*", LABS, index=0)
+            accompagnants = st.number_input("Accompagnants (optionnel)", min_value=0, max_value=10, value=0, step=1) \
+                if accomp_open else 0
+            commentaire = st.text_area("Commentaire", value="", height=80)
+            attente = st.form_submit_button("Rejoindre la liste d'attente")
+        if attente:
+            if not nom.strip() or not prenom.strip() or not email.strip():
+                st.warning("Merci de remplir tous les champs obligatoires (*).")
+                st.stop()
+            try:
+                WL = get_waitlist_worksheet()
+                with WL.write_lock:
+                    if nom_prenom_deja_inscrit(WS, nom, prenom, event_id, DEFAULT_EVENT_ID) \
+                            or nom_prenom_deja_inscrit(WL, nom, prenom, event_id, DEFAULT_EVENT_ID):
+                        st.info("Cette personne est déjà inscrite ou sur la liste d'attente.")
+                        st.stop()
+                    append_inscription(WL, {
+                        "nom": nom.strip(),
+                        "prenom": prenom.strip(),
+                        "email": email.strip(),
+                        "laboratoire": laboratoire,
+                        "accompagnants": int(accompagnants),
+                        "commentaire": commentaire.strip(),
+                        "created_at": datetime.now().isoformat(timespec="seconds"),
+                        "event_id": event_id,
+                    })
+            except Exception:
+                logging.exception("Échec de l'inscription sur la liste d'attente")
+                st.error("Votre demande n'a pas pu être enregistrée : le service est très sollicité. Réessayez dans une minute.")
+                st.stop()
+            st.success("Vous êtes sur la liste d'attente. L'organisateur vous contactera si une place se libère.")
         st.stop()
 
+    # Jeton de soumission unique : un double envoi réaffiche la confirmation d'origine
+    if "jeton_inscription" not in st.session_state:
+        st.session_state.jeton_inscription = uuid.uuid4().hex
+
     with st.form("form_inscription", border=True):
         col1, col2 = st.columns(2)
         with col1:
@@ -177,44 +290,71 @@ with tab_inscription:
         submitted = st.form_submit_button("S'inscrire")
 
         if submitted:
-            if not nom.strip() or not prenom.strip() or not email.strip():
-                st.warning("Merci de remplir tous les champs obligatoires (*).")
-                st.stop()
-
-            # Blocage des doublons par Nom + Prénom
-            if nom_prenom_deja_inscrit(WS, nom, prenom):
-                st.warning("Cette personne est déjà inscrite. Si vous devez modifier votre inscription, contactez l’organisateur.")
-                st.stop()
-
-            # Recalcul juste avant écriture pour éviter contention
-            _, r = get_places_stats(WS)
-            if r <= 0:
-                st.error("Désolé, c'est complet maintenant.")
+            # Même session + même contenu = même soumission (double clic, rechargement)
+            jeton = (st.session_state.jeton_inscription, event_id, nom.strip().lower(), prenom.strip().lower(),
+                     email.strip().lower(), laboratoire, int(accompagnants), commentaire.strip())
+            deja = reserver_jeton(jeton)
+            if deja is not None:
+                _, niveau, message = deja
+                getattr(st, niveau)(message)
                 st.stop()
 
-            max_accomp_now = max(r - 1, 0)
-            accomp_enregistre = min(accompagnants, max_accomp_now)
-
-            data = {
-                "nom": nom.strip(),
-                "prenom": prenom.strip(),
-                "email": email.strip(),
-                "laboratoire": laboratoire,
-                "accompagnants": int(accomp_enregistre),
-                "commentaire": commentaire.strip(),
-                "created_at": datetime.now().isoformat(timespec="seconds"),
-            }
+            # Le jeton est libéré dans tous les cas où rien n'a été enregistré,
+            # y compris quand st.stop() ou un rerun (BaseException) interrompt le script
+            enregistre = False
             try:
-                append_inscription(WS, data)
-                if accomp_enregistre < accompagnants:
-                    st.info(f"Inscription enregistrée. Les accompagnants ont été ajustés à {accomp_enregistre} en fonction des places restantes (priorité aux salariés).")
-                else:
-                    st.success("Inscription enregistrée. À bientôt sur le terrain !")
-                st.toast("Inscription confirmée ✅")
-                st.balloons()
-            except Exception as e:
-                st.error("Échec de l'enregistrement dans Google Sheets. Vérifie les droits/quotas.")
-                st.exception(e)
+                if not nom.strip() or not prenom.strip() or not email.strip():
+                    st.warning("Merci de remplir tous les champs obligatoires (*).")
+                    st.stop()
+
+                # Contrôles juste avant écriture, sous le verrou d'écriture du process :
+                # la copie locale vient d'être rafraîchie par la dernière inscription
+                with WS.write_lock:
+                    # Blocage des doublons par Nom + Prénom (casse, espaces et accents ignorés)
+                    if nom_prenom_deja_inscrit(WS, nom, prenom, event_id, DEFAULT_EVENT_ID):
+                        st.warning("Cette personne est déjà inscrite. Si vous devez modifier votre inscription, contactez l’organisateur.")
+                        st.stop()
+
+                    r, disponibles = places_disponibles_labo(WS, EVENT, laboratoire, DEFAULT_EVENT_ID)
+                    if r <= 0:
+                        st.error("Désolé, c'est complet maintenant. Rechargez la page pour rejoindre la liste d'attente.")
+                        st.stop()
+                    if disponibles <= 0:
+                        st.error(f"Désolé, il n'y a plus de places disponibles pour le laboratoire {laboratoire}.")
+                        st.stop()
+
+                    max_accomp_now = max(disponibles - 1, 0)
+                    accomp_enregistre = min(accompagnants, max_accomp_now)
+
+                    data = {
+                        "nom": nom.strip(),
+                        "prenom": prenom.strip(),
+                        "email": email.strip(),
+                        "laboratoire": laboratoire,
+                        "accompagnants": int(accomp_enregistre),
+                        "commentaire": commentaire.strip(),
+                        "created_at": datetime.now().isoformat(timespec="seconds"),
+                        "event_id": event_id,
+                    }
+                    try:
+                        append_inscription(WS, data)
+                    except Exception:
+                        logging.exception("Échec de l'enregistrement dans Google Sheets")
+                        st.error("Votre inscription n'a pas pu être enregistrée : le service est très sollicité. "
+                                 "Réessayez dans une minute, vos informations sont conservées dans le formulaire.")
+                        st.stop()
+                    if accomp_enregistre < accompagnants:
+                        niveau, message = "info", f"Inscription enregistrée. Les accompagnants ont été ajustés à {accomp_enregistre} en fonction des places restantes (priorité aux salariés)."
+                    else:
+                        niveau, message = "success", "Inscription enregistrée. À bientôt sur le terrain !"
+                    enregistrer_jeton(jeton, niveau, message)
+                    enregistre = True
+            finally:
+                if not enregistre:
+                    liberer_jeton(jeton)
+            getattr(st, niveau)(message)
+            st.toast("Inscription confirmée ✅")
+            st.balloons()
 
     expander_title = "Déjà inscrit ? Ajouter des accompagnants ✅" if accomp_open \
                      else "Déjà inscrit ? Ajouter des accompagnants (à partir du 01/09/2025)"
@@ -246,12 +386,40 @@ with tab_admin:
             else:
                 st.error("Mot de passe incorrect.")
     else:
-        df = gsheet_to_df(WS)
-        total, restantes = get_places_stats(WS)
+        df = gsheet_to_df(WS, DEFAULT_EVENT_ID)
+        df = df[df["event_id"] == event_id]
+        st.caption(f"Séance : {EVENT['titre']}")
+        total, restantes = get_places_stats(WS, EVENT, DEFAULT_EVENT_ID)
         k1, k2, k3 = st.columns(3)
-        k1.metric("Capacité", MAX_PLACES)
-        k2.metric("Places prises", MAX_PLACES - restantes)
+        k1.metric("Capacité", CAPACITE)
+        k2.metric("Places prises", CAPACITE - restantes)
         k3.metric("Restantes", restantes)
+        st.caption("Appels API Google Sheets depuis le démarrage : "
+                   + (", ".join(f"{k} {v}" for k, v in sorted(WS.api_calls.items())) or "aucun")
+                   + f" – inscriptions en attente d'envoi : {WS.pending_count()}")
+        api_stats = WS.api_stats_snapshot()
+        if api_stats:
+            st.dataframe(pd.DataFrame([
+                {"appel": methode, "appels": s["calls"], "erreurs": s["errors"], "nouvelles tentatives": s["retries"],
+                 "latence moy. (ms)": round(1000 * s["latency_s"] / s["calls"]),
+                 "latence max (ms)": round(1000 * s["max_latency_s"]),
+                 "attente quota (s)": round(s["throttled_s"], 1)}
+                for methode, s in sorted(api_stats.items())
+            ]), hide_index=True)
+
+        with st.expander("Liste d'attente (dans l'ordre d'arrivée)"):
+            try:
+                df_attente = gsheet_to_df(get_waitlist_worksheet(), DEFAULT_EVENT_ID)
+            except Exception:
+                logging.exception("Lecture de la liste d'attente impossible")
+                st.error("Liste d'attente indisponible pour le moment.")
+            else:
+                df_attente = df_attente[df_attente["event_id"] == event_id]
+                if df_attente.empty:
+                    st.info("Personne en attente.")
+                else:
+                    st.dataframe(df_attente[["nom", "prenom", "email", "laboratoire", "accompagnants",
+                                             "commentaire", "created_at"]], hide_index=True)
 
         lab_filter = st.multiselect("Filtrer par laboratoire", LABS, [])
         if lab_filter and not df.empty:
@@ -276,6 +444,9 @@ with tab_admin:
             agg = full.merge(agg, on="laboratoire", how="left").fillna(0)
             for col in ["inscrits", "accompagnants", "total"]:
                 agg[col] = agg[col].astype(int)
+            # Quotas / places réservées de la séance (vides si non configurés)
+            agg["quota"] = agg["laboratoire"].map(EVENT.get("quotas", {})).astype("Int64")
+            agg["reserve"] = agg["laboratoire"].map(EVENT.get("reserves", {})).fillna(0).astype(int)
 
             st.subheader("Répartition par laboratoire")
             metric = st.radio("Choisir l'indicateur à afficher", ["inscrits", "accompagnants", "total"], index=2, horizontal=True)
@@ -283,7 +454,7 @@ with tab_admin:
             st.bar_chart(chart_df)
 
             with st.expander("Détails par laboratoire"):
-                st.dataframe(agg.rename(columns={"inscrits":"Inscrits","accompagnants":"Accompagnants","total":"Total (avec accompagnants)"}), use_container_width=True, hide_index=True)
+                st.dataframe(agg.rename(columns={"inscrits":"Inscrits","accompagnants":"Accompagnants","total":"Total (avec accompagnants)","quota":"Quota","reserve":"Places réservées"}), use_container_width=True, hide_index=True)
 
         st.dataframe(df, use_container_width=True, hide_index=True)
 